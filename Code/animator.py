@@ -0,0 +1,701 @@
+import os
+import queue
+import threading
+import logging
+import time
+import numpy as np
+from lib import LCD_2inch, dual_lcd, rgb565
+from lib.frame_pipeline import FramePipeline
+from PIL import Image
+import emotion_pack
+import face_renderer
+import overlay
+from frame_cache import FrameCache, DEFAULT_BUDGET
+from frame_stream import FrameStream
+
+# Above this fraction of changed pixels one full-frame write beats several region writes
+FULL_REFRESH_RATIO = 0.5
+
+# Seconds from start-up until something is on the panel, a blank frame if the boot
+# animation's first frame is not decoded by then
+FIRST_FRAME_BUDGET = 0.5
+
+# Without an interaction event for IDLE_AFTER seconds animations drop to IDLE_FPS
+# and the backlight to IDLE_BACKLIGHT percent, until the next event
+IDLE_AFTER = 30.0
+IDLE_FPS = 10
+IDLE_BACKLIGHT = 30
+
+# Ways of switching from one emotion to the next, None cuts
+TRANSITIONS = ('fade', 'wipe', None)
+
+# What the render thread does with the animation it is playing, weakest first
+_CONTINUE = 0
+_STOP_AT_LOOP_END = 1
+_STOP_NOW = 2
+_QUIT = 3
+
+# Commands that count as interaction, waking the display from its idle state
+_EVENTS = ('play', 'enqueue', 'frame', 'overlay', 'gaze', 'event')
+
+class Animator:
+    """
+    Owns the LCD and plays emotions on a render thread. DisplayControl (display_module)
+    drives it, normally from inside the display renderer process.
+    """
+
+    def __init__(self, disp=None, delta=True, emotion_fps=None, cache_bytes=DEFAULT_BUDGET,
+                 transition='fade', transition_frames=4, boot=None, first_frame_budget=FIRST_FRAME_BUDGET,
+                 started=None, dual_eyes=False, idle_after=IDLE_AFTER, idle_fps=IDLE_FPS,
+                 idle_backlight=IDLE_BACKLIGHT):
+        """
+        Initialize the LCD display and start the render thread
+
+        :param disp: LCD driver instance, LCD_2inch by default, which skips its init sequence when
+            restarted without a reboot
+        :param delta: Only send the regions that changed since the previous frame
+        :param emotion_fps: Frame rate per emotion, overriding the rate stored in its pack
+        :param cache_bytes: Memory budget for decoded frames
+        :param transition: How to switch between emotions, one of TRANSITIONS
+        :param transition_frames: Blended frames shown between two emotions
+        :param boot: Emotion streamed as soon as possible, while the panel is initialized
+        :param first_frame_budget: Seconds after started within which something is shown
+        :param started: time.monotonic() of the process start-up, now by default
+        :param dual_eyes: Without disp, drive two round panels as the eyes (lib.dual_lcd) instead
+        :param idle_after: Seconds without interaction events before the display idles, None never
+        :param idle_fps: Frame rate animations are lowered to while idle, 0 holds the frame
+            until the next event
+        :param idle_backlight: Backlight duty cycle in percent while idle
+        """
+        self.started = started if started is not None else time.monotonic()
+        self.first_frame_time = None  # Seconds from started until the first frame was queued
+        self.image_dir = emotion_pack.EMOTIONS_DIR
+        self.packs = {}  # Memory-mapped emotion packs, opened on first use
+        self._streams = {}  # emotion -> (FrameStream, deadline of its first frame or None), of queued emotions
+        self._active_stream = None
+        if boot is not None:
+            # Decoding starts before Init(), which spends a good part of the budget sleeping
+            self._open_stream(boot, self.started + first_frame_budget)
+        if disp is None:
+            disp = dual_lcd.DualLCD(warm_start=True) if dual_eyes else LCD_2inch.LCD_2inch(warm_start=True)
+        self.disp = disp
+        self.disp.Init()
+        self._pipeline = FramePipeline(self.disp)  # Sends frame N while frame N+1 is prepared
+        self.cache = FrameCache(self._load_emotion, cache_bytes)
+        self.face = None  # FaceRenderer for procedural emotions, created on first use
+        self.overlay = overlay.Overlay()  # Status text and icons drawn over every frame
+        self.delta = delta
+        self.emotion_fps = dict(emotion_fps or {})
+        self.dropped_frames = 0  # Frames skipped to keep animations on schedule
+        self.transition = None
+        self.transition_frames = 0
+        self._blended = None  # Scratch frame for transitions
+        self._decoded = None  # Scratch frame packed frames are expanded into
+        self._decoded_frame = None  # Packed frame currently in _decoded
+        self._shown = None  # Last frame sent to the panel, for delta updates
+        self._base = None  # Copy of the last frame presented, before the gaze and overlay
+        self._gazed = None  # Scratch frame for gaze shifts
+        self.gaze = (0, 0)
+        self._panned = 0  # Gaze offset the panel's hardware scrolling currently applies
+        self.current_emotion = None
+        if idle_fps < 0:
+            raise ValueError(f"idle_fps must be 0 or more, got {idle_fps}")
+        self.idle_after = idle_after
+        self.idle_period = 1.0 / idle_fps if idle_fps else None  # None holds the frame while idle
+        self.idle_backlight = idle_backlight
+        self._idle = False
+        self._last_event = self.started  # time.monotonic() of the last interaction event
+
+        # Everything below is owned by the render thread, other threads only send commands
+        # Commands are applied in the order they were sent; they all take effect at the
+        # next poll, an interrupt only decides whether the animation stops at once
+        self._commands = queue.Queue()
+        self.set_transition(transition, transition_frames)
+        self._playlist = []  # (emotion, loops, duration) to play before going back to idle
+        self._idle_emotion = None
+        self._raw_frame = None  # (frame, release) pushed through show_frame
+        self._playing_idle = False
+        self._playing_forever = False
+        self.render_thread = threading.Thread(target=self._render_loop, daemon=True)
+        self.render_thread.start()
+        if boot is not None:
+            self.play(boot, 1)
+
+    def play(self, emotion, loops=1, interrupt=False):
+        """
+        Replace whatever is playing or queued by an emotion. Returns immediately.
+
+        :param loops: How many times to loop through the frames (-1 for infinite)
+        :param interrupt: Switch at the next frame instead of at the end of the current loop
+        """
+        self._send('play', emotion, loops, None, interrupt)
+
+    def play_for(self, emotion, duration, loops=1, interrupt=True):
+        """
+        Play an emotion stretched or squeezed to last exactly duration seconds,
+        for instance to match a sound clip. Returns immediately.
+        """
+        if not duration > 0:
+            raise ValueError(f"Duration must be more than 0 seconds, got {duration}")
+        self._send('play', emotion, loops, duration, interrupt)
+
+    def stream(self, emotion):
+        """
+        Play an emotion once, starting as soon as its first frame is decoded while a
+        background reader decodes the next ones. Nothing of it is kept in the cache.
+        """
+        self._send('stream', emotion)
+        self.play(emotion, 1)
+
+    def enqueue_next(self, emotion, loops=1):
+        """Play an emotion after the ones already queued. Returns immediately."""
+        self._send('enqueue', emotion, loops, None)
+
+    def interrupt(self):
+        """Drop the queued emotions and stop the current one at the next frame"""
+        self._send('stop', True)
+
+    def set_idle(self, emotion):
+        """Emotion looped whenever nothing else is playing, None to keep the last frame"""
+        self._send('idle', emotion)
+
+    def set_transition(self, transition, frames=4):
+        """Cross-fade ('fade') or wipe ('wipe') over frames frames when the emotion changes, None to cut"""
+        if transition not in TRANSITIONS:
+            raise ValueError(f"Unknown transition {transition}, expected one of {TRANSITIONS}")
+        frames = int(frames)
+        if frames < 0:
+            raise ValueError(f"Transition frames must be 0 or more, got {frames}")
+        self._send('transition', transition, frames)
+
+    def set_overlay_text(self, name, text, x=4, y=4, color=overlay.TEXT_COLOR):
+        """
+        Show a line of text over the face until it is replaced or cleared, placed at
+        (x, y) of the frame, negative values counting from the right or bottom edge
+        """
+        self._send('overlay', 'set_text', name, str(text), int(x), int(y), overlay.parse_color(color))
+
+    def set_overlay_icon(self, name, icon, x=4, y=4, color=overlay.TEXT_COLOR):
+        """Show one of overlay.ICONS over the face, see set_overlay_text"""
+        if icon not in overlay.ICONS:
+            raise ValueError(f"Unknown icon {icon}, expected one of {tuple(overlay.ICONS)}")
+        self._send('overlay', 'set_icon', name, icon, int(x), int(y), overlay.parse_color(color))
+
+    def clear_overlay(self, name=None):
+        """Remove one overlay item, or all of them"""
+        self._send('overlay', 'remove', name)
+
+    def set_gaze(self, x, y=0):
+        """
+        Show the face moved x pixels right and y pixels down, with black margins, to
+        look towards someone. Along the axis the panel can scroll (SCROLL_LINES, the
+        long side of the 2 inch panel) the frame is not resent, only the scroll start
+        and the margin strip; other offsets resend the parts of the face that moved.
+        The overlay moves with the face.
+        """
+        self._send('gaze', int(x), int(y))
+
+    def notify_event(self):
+        """
+        Tell the display something happened (someone moved, clapped...), which brings it
+        back from its idle state to full rate and brightness at the next frame. Playing
+        an emotion, showing a frame, the overlay and the gaze count as events too.
+        """
+        self._send('event')
+
+    def prefetch(self, emotions):
+        """Decode emotions in the background because they are about to be played"""
+        self.cache.prefetch(emotions)
+
+    def stop_animation(self, stop_now=False):
+        """Stop the current animation (at the end of its loop unless stop_now) and clear the queue"""
+        self._send('stop', stop_now)
+
+    def show_frame(self, frame, release=None):
+        """
+        Interrupt the current animation and show one (h, w) RGB565 frame until the next
+        command. release() is called once the frame has been copied and may be reused.
+        """
+        self._send('frame', frame, release)
+
+    def clear(self):
+        """Clear the display"""
+        self._send('clear')
+
+    def stats(self):
+        """Playback counters, for logging and benchmarks"""
+        return {'current_emotion': self.current_emotion, 'dropped_frames': self.dropped_frames,
+                'first_frame': self.first_frame_time, 'idle': self._idle, 'cache': self.cache.stats()}
+
+    def close(self):
+        """Stop the render thread once it reaches a frame boundary"""
+        self._send('quit')
+        self.render_thread.join()
+        self._pipeline.close()
+
+    def _send(self, *command):
+        self._commands.put(command)
+
+    def _render_loop(self):
+        """Body of the render thread: play queued emotions, else the idle one"""
+        while True:
+            if self._raw_frame is not None:
+                frame, release = self._raw_frame
+                self._raw_frame = None
+                self.current_emotion = None
+                try:
+                    self._present(frame)
+                except ValueError as e:
+                    logging.error(f"Error showing frame: {e}")
+                finally:
+                    if release is not None:
+                        release()
+                # Keep the frame on screen until told otherwise
+                if self._poll_commands(block=True) == _QUIT:
+                    return
+                continue
+            if self._playlist:
+                emotion, loops, duration = self._playlist.pop(0)
+                self._playing_idle = False
+            elif self._idle_emotion is not None:
+                emotion, loops, duration = self._idle_emotion, -1, None
+                self._playing_idle = True
+            else:
+                # Nothing to play, sleep until a command arrives
+                if self._poll_commands(block=True) == _QUIT:
+                    return
+                continue
+            self._playing_forever = loops < 0
+            action = self._play_animation(emotion, loops, duration)
+            if self._active_stream is not None:
+                self._active_stream.close()
+                self._active_stream = None
+            if action == _QUIT:
+                return
+
+    def _poll_commands(self, block=False, timeout=None):
+        """
+        Apply the pending commands and return what to do with the current animation.
+        Blocking without a timeout still wakes up to enter the idle state on time.
+        """
+        action = _CONTINUE
+        while True:
+            wait = timeout
+            if block and timeout is None and not self._idle and self.idle_after is not None:
+                wait = max(self._last_event + self.idle_after - time.monotonic(), 0)
+            try:
+                command = self._commands.get(block=block, timeout=wait)
+            except queue.Empty:
+                if block and timeout is None:
+                    self._update_idle()
+                    continue
+                return action
+            block = False
+            try:
+                action = max(action, self._apply(command))
+            except Exception:
+                # A bad command must not end the render thread, the panel would freeze
+                logging.exception(f"Error applying display command {command[0]}")
+
+    def _wait_until(self, deadline):
+        """
+        Handle commands until deadline (None waits for ever), returning early only to
+        stop the animation now or to leave the idle state
+        """
+        action = _CONTINUE
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return action
+            idle = self._idle
+            action = max(action, self._poll_commands(block=True, timeout=remaining))
+            if action >= _STOP_NOW or (idle and not self._idle):
+                return action
+
+    def _update_idle(self):
+        """Enter the idle state once idle_after seconds passed without an event"""
+        if self._idle or self.idle_after is None or time.monotonic() - self._last_event < self.idle_after:
+            return
+        self._idle = True
+        self._pipeline.run(self.disp.bl_DutyCycle, self.idle_backlight)
+
+    def _wake(self):
+        """Record an interaction event, restoring the backlight if the display was idle"""
+        self._last_event = time.monotonic()
+        if self._idle:
+            self._idle = False
+            self._pipeline.run(self.disp.bl_DutyCycle, 100)
+
+    def _apply(self, command):
+        op, args = command[0], command[1:]
+        if op in _EVENTS:
+            self._wake()
+        if op == 'event':
+            return _CONTINUE
+        if op == 'play':
+            emotion, loops, duration, interrupt = args
+            self._drop_raw_frame()  # Sent before the play, so the play replaces it
+            self._playlist = [(emotion, loops, duration)]
+            self._close_streams()
+            return _STOP_NOW if interrupt or self._playing_idle else _STOP_AT_LOOP_END
+        if op == 'enqueue':
+            self._playlist.append(args)
+            if self._playing_idle:
+                return _STOP_NOW
+            return _STOP_AT_LOOP_END if self._playing_forever else _CONTINUE
+        if op == 'idle':
+            changed = args[0] != self._idle_emotion
+            if changed:
+                if self._idle_emotion is not None:
+                    self.cache.unpin(self._idle_emotion)
+                if args[0] is not None:
+                    self.cache.pin(args[0])
+            self._idle_emotion = args[0]
+            return _STOP_AT_LOOP_END if changed and self._playing_idle else _CONTINUE
+        if op == 'stream':
+            self._open_stream(args[0])
+            return _CONTINUE
+        if op == 'stop':
+            self._playlist = []
+            self._close_streams()
+            return _STOP_NOW if args[0] else _STOP_AT_LOOP_END
+        if op == 'frame':
+            self._drop_raw_frame()
+            self._raw_frame = args
+            self._playlist = []
+            self._close_streams()
+            return _STOP_NOW
+        if op == 'overlay':
+            getattr(self.overlay, args[0])(*args[1:])
+            self._refresh()
+            return _CONTINUE
+        if op == 'gaze':
+            self.gaze = args
+            self._refresh()
+            return _CONTINUE
+        if op == 'transition':
+            self.transition, self.transition_frames = args
+            return _CONTINUE
+        if op == 'clear':
+            self._shown = None
+            self._base = None
+            self._pipeline.run(self.disp.clear)
+            return _CONTINUE
+        if op == 'quit':
+            return _QUIT
+        raise ValueError(f"Unknown display command {op}")
+
+    def _close_streams(self):
+        """Close the pending streams of emotions no longer queued, they would hold decoded frames for ever"""
+        queued = {emotion for emotion, _, _ in self._playlist}
+        for emotion in [emotion for emotion in self._streams if emotion not in queued]:
+            self._streams.pop(emotion)[0].close()
+
+    def _drop_raw_frame(self):
+        """Forget a frame from show_frame that was replaced before it was shown"""
+        if self._raw_frame is not None and self._raw_frame[1] is not None:
+            self._raw_frame[1]()
+        self._raw_frame = None
+
+    def _load_pack(self, emotion):
+        """Return the pack of an emotion, or None if it was not built yet"""
+        if emotion not in self.packs:
+            path = emotion_pack.pack_path(emotion, self.image_dir)
+            if os.path.exists(path):
+                try:
+                    self.packs[emotion] = emotion_pack.EmotionPack(path)
+                except ValueError as e:
+                    logging.warning(f"{e}, decoding frame images instead. Run emotion_pack.py to rebuild it.")
+                    self.packs[emotion] = None
+            else:
+                logging.warning(f"No pack for emotion {emotion}, decoding frame images instead. "
+                                f"Run emotion_pack.py to build it.")
+                self.packs[emotion] = None
+        return self.packs[emotion]
+
+    def _load_emotion(self, emotion):
+        """
+        Cache loader: every frame of an emotion in memory, and its fps. Frames of a pack
+        stay compressed and are expanded as they are played.
+        """
+        pack = self._load_pack(emotion)
+        if pack is not None:
+            return [pack.frame(j).copy() for j in range(len(pack))], pack.fps
+        frames = []
+        for filename in emotion_pack.list_frames(emotion, self.image_dir):
+            with Image.open(filename) as image:
+                frames.append(rgb565.from_rgb888(image.convert('RGB')))
+        return frames, emotion_pack.DEFAULT_FPS
+
+    def _frame_source(self, emotion, looped=False):
+        """
+        Return the frame count and frame rate of an emotion, and a function giving
+        frame j as an RGB565 array. looped tells it will be played more than once.
+        """
+        if emotion in face_renderer.EMOTIONS:
+            return self._procedural_source(emotion)
+        if emotion in self._streams:
+            return self._stream_source(emotion, looped)
+        frames, fps = self.cache.get(emotion)
+        self.cache.played(emotion)
+        return len(frames), self.emotion_fps.get(emotion, fps), lambda j: self._expand(frames[j])
+
+    def _expand(self, frame):
+        """RGB565 array of a cached frame, decoding packed frames into a reused buffer"""
+        if isinstance(frame, np.ndarray):
+            return frame
+        if frame is self._decoded_frame:
+            return self._decoded  # A held frame, shared by the cache, is decoded once
+        if self._decoded is None or self._decoded.shape != frame.shape:
+            self._decoded = np.empty(frame.shape, dtype='>u2')
+        self._decoded_frame = frame
+        return frame.decode(self._decoded)
+
+    def _open_stream(self, emotion, deadline=None):
+        """Start decoding an emotion for the next time it is played"""
+        def source():
+            # On the stream's reader thread, the caller does not wait for the disk
+            pack = self._load_pack(emotion)
+            if pack is not None:
+                return len(pack), pack.fps, lambda j: pack.frame(j).decode()
+            filenames = emotion_pack.list_frames(emotion, self.image_dir)
+
+            def read(j):
+                with Image.open(filenames[j]) as image:
+                    return rgb565.from_rgb888(image.convert('RGB'))
+            return len(filenames), emotion_pack.DEFAULT_FPS, read
+        previous = self._streams.get(emotion)
+        self._streams[emotion] = (FrameStream(source), deadline)
+        if previous is not None:
+            previous[0].close()
+
+    def _stream_source(self, emotion, looped):
+        """
+        Frame source of an emotion with a pending stream. The stream only covers the
+        first pass; a looped emotion is loaded into the cache meanwhile and the later
+        loops come from there.
+        """
+        stream, deadline = self._streams.pop(emotion)
+        self._active_stream = stream
+        if deadline is not None and self._shown is None:
+            if not stream.wait_open(max(deadline - time.monotonic(), 0)):
+                self._present(np.zeros(self._landscape_shape(), dtype='>u2'))
+        stream.wait_open()
+        if looped:
+            self.cache.prefetch([emotion])
+        cached = []  # Frames from the cache once the stream has gone through them
+        last = [-1]
+
+        def get_frame(j):
+            if not cached and j < last[0]:
+                # Second loop: the stream cannot go back
+                stream.close()
+                frames, _ = self.cache.get(emotion)
+                self.cache.played(emotion)
+                cached.append(frames)
+            last[0] = j
+            if cached:
+                return self._expand(cached[0][j])
+            return self._stream_frame(stream, j, deadline)
+        return stream.count, self.emotion_fps.get(emotion, stream.fps), get_frame
+
+    def _stream_frame(self, stream, j, deadline):
+        """Frame j of a stream, painting a blank frame if the first one misses its deadline"""
+        if j == 0 and deadline is not None and self._shown is None:
+            try:
+                return stream.get(0, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self._present(np.zeros(self._landscape_shape(), dtype='>u2'))
+        return stream.get(j)
+
+    def _landscape_shape(self):
+        """(h, w) of full frames, landscape when the panel can rotate"""
+        if getattr(self.disp, 'MADCTL_LANDSCAPE', None) is not None:
+            return self.disp.width, self.disp.height
+        return self.disp.height, self.disp.width
+
+    def _procedural_source(self, emotion):
+        """Frame source of a procedural emotion, rendered from its curve as it plays"""
+        if self.face is None:
+            height, width = self._landscape_shape()
+            self.face = face_renderer.FaceRenderer(width, height)
+        curve = face_renderer.EMOTIONS[emotion]
+        fps = self.emotion_fps.get(emotion, curve.fps)
+        frames = max(1, round(curve.duration * fps))
+        return frames, fps, lambda j: self.face.render(curve.at(j / fps))
+
+    def _play_animation(self, emotion, count, duration=None):
+        """
+        Play an emotion on a fixed schedule: frame k is due at start + k / fps on the
+        monotonic clock. Frames whose slot has already passed are dropped rather than
+        stretching the animation. Commands are handled while waiting for the next slot.
+        """
+        try:
+            frames, fps, get_frame = self._frame_source(emotion, count != 1)
+        except (IOError, ValueError) as e:
+            return self._playback_failed(f"Error loading emotion {emotion}: {e}")
+        if frames == 0:
+            return _CONTINUE
+        if duration:
+            fps = frames * max(count, 1) / duration
+        period = 1.0 / fps
+        total = frames * count if count >= 0 else None
+        stop_at_loop_end = False
+        lowered = False  # The last wait was stretched to the idle frame rate
+        if self.transition and self.transition_frames > 0 and emotion != self.current_emotion:
+            try:
+                action = self._transition(get_frame(0), period)
+            except (IOError, ValueError) as e:
+                return self._playback_failed(f"Error showing emotion {emotion}: {e}")
+            if action >= _STOP_NOW:
+                return action
+            stop_at_loop_end = action == _STOP_AT_LOOP_END
+        self.current_emotion = emotion
+        start = time.monotonic()
+        k = 0
+        while total is None or k < total:
+            action = self._poll_commands()
+            if action >= _STOP_NOW:
+                return action
+            stop_at_loop_end = stop_at_loop_end or action == _STOP_AT_LOOP_END
+            self._update_idle()
+
+            # Behind schedule: jump to the frame due now, but not past the end of the
+            # animation or of the loop it has to stop after
+            due = int((time.monotonic() - start) / period)
+            if due > k:
+                if stop_at_loop_end:
+                    due = min(due, (k // frames + 1) * frames - 1)
+                elif total is not None:
+                    due = min(due, total - 1)
+                if not lowered:
+                    self.dropped_frames += due - k
+                k = due
+            shown = time.monotonic()
+            try:
+                self._present(get_frame(k % frames))
+            except (IOError, ValueError) as e:
+                return self._playback_failed(f"Error showing emotion {emotion}: {e}")
+            k += 1
+            if stop_at_loop_end and k % frames == 0:
+                return _CONTINUE
+            deadline = start + k * period
+            lowered = self._idle and (self.idle_period is None or shown + self.idle_period > deadline)
+            if lowered:
+                # Idle: the animation keeps its speed but skips frames, woken early by an event
+                deadline = shown + self.idle_period if self.idle_period is not None else None
+            action = self._wait_until(deadline)
+            if action >= _STOP_NOW:
+                return action
+            stop_at_loop_end = stop_at_loop_end or action == _STOP_AT_LOOP_END
+        return _CONTINUE
+
+    def _playback_failed(self, message):
+        """Log why an emotion could not be played and go on with the next one"""
+        logging.error(message)
+        if self._playing_idle:
+            self._idle_emotion = None  # Do not retry a broken idle emotion forever
+        return _CONTINUE
+
+    def _transition(self, incoming, period):
+        """
+        Blend from the frame on the panel to the first frame of the next emotion,
+        one step per frame period. Returns what to do with the incoming emotion.
+        """
+        if self._base is None or self._base.shape != incoming.shape:
+            return _CONTINUE
+        outgoing = self._base.copy()  # Overwritten by each blended frame
+        if self._blended is None or self._blended.shape != incoming.shape:
+            self._blended = np.empty(incoming.shape, dtype='>u2')
+        steps = self.transition_frames + 1
+        action = _CONTINUE
+        start = time.monotonic()
+        for i in range(1, steps):
+            if self.transition == 'wipe':
+                rgb565.wipe(outgoing, incoming, incoming.shape[1] * i // steps, out=self._blended)
+            else:
+                rgb565.blend(outgoing, incoming, 32 * i // steps, out=self._blended)
+            self._present(self._blended)
+            action = max(action, self._wait_until(start + i * period))
+            if action >= _STOP_NOW:
+                break
+        return action
+
+    def _refresh(self):
+        """Show an overlay or gaze change at once, sending only the parts of the frame it changed"""
+        if self._base is not None:
+            self._present(self._base, delta=True)
+
+    def _scroll_axis(self, shape, landscape):
+        """Frame axis the panel can move by scrolling (0 rows, 1 columns), or None"""
+        lines = getattr(self.disp, 'SCROLL_LINES', None)
+        axis = 1 if landscape else 0
+        return axis if lines is not None and lines == shape[axis] else None
+
+    def _gaze(self, frame, landscape):
+        """
+        frame moved by the gaze, in a reused buffer. Along the scrolling axis the frame
+        stays put and the strip that pan() wraps around to the other edge is blanked.
+        """
+        if self.gaze == (0, 0):
+            return frame
+        if self._gazed is None or self._gazed.shape != frame.shape:
+            self._gazed = np.empty(frame.shape, dtype='>u2')
+        scroll_axis = self._scroll_axis(frame.shape, landscape)
+        target, source, blank = [], [], [slice(None), slice(None)]
+        for axis, offset in ((0, self.gaze[1]), (1, self.gaze[0])):
+            size = frame.shape[axis]
+            offset = max(-size, min(offset, size))
+            if axis == scroll_axis:
+                blank[axis] = slice(size - offset, size) if offset > 0 else slice(0, -offset)
+                offset = 0
+            target.append(slice(max(offset, 0), size + min(offset, 0)))
+            source.append(slice(max(-offset, 0), size + min(-offset, 0)))
+        self._gazed.fill(0)
+        self._gazed[tuple(target)] = frame[tuple(source)]
+        if scroll_axis is not None:
+            self._gazed[tuple(blank)] = 0
+        return self._gazed
+
+    def _pan(self, offset, landscape):
+        """Have the panel scroll the picture by offset, on the writer thread in frame order"""
+        if offset != self._panned:
+            self._pipeline.run(self.disp.pan, offset, landscape)
+            self._panned = offset
+
+    def _present(self, frame, delta=None):
+        """
+        Copy a (h, w) RGB565 frame, moved by the gaze and with the overlay over it, into
+        a free pipeline buffer and queue it for the writer thread, only the parts that
+        changed when delta is on, and always while idle
+        """
+        if frame.shape not in ((self.disp.height, self.disp.width), (self.disp.width, self.disp.height)):
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not fit the display")
+        landscape = frame.shape != (self.disp.height, self.disp.width)
+        if self._base is None or self._base.shape != frame.shape:
+            self._base = np.empty(frame.shape, dtype='>u2')
+        if frame is not self._base:
+            np.copyto(self._base, frame)  # Frames are often reused buffers
+        frame = self.overlay.compose(self._gaze(frame, landscape))
+        axis = self._scroll_axis(frame.shape, landscape)
+        panned = 0 if axis is None else self.gaze[1 - axis]
+        rects = None
+        if delta is None:
+            delta = self.delta or self._idle  # Idle frames that did not change are not resent
+        if delta and self._shown is not None and self._shown.shape == frame.shape:
+            # The shown buffer may still be on its way to the panel, reading it is safe
+            rects = rgb565.dirty_rects(self._shown, frame)
+            if not rects:
+                self._pan(panned, landscape)
+                return  # Nothing else is sent for an unchanged frame
+            if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects) >= frame.size * FULL_REFRESH_RATIO:
+                rects = None
+        buf = self._pipeline.acquire(frame.shape)
+        np.copyto(buf, frame)
+        self._shown = buf
+        self._pipeline.submit(buf, rects, landscape)
+        self._pan(panned, landscape)  # After the frame, whose blanked strip becomes the margin
+        if self.first_frame_time is None:
+            self.first_frame_time = time.monotonic() - self.started
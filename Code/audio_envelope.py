@@ -0,0 +1,82 @@
+import numpy as np
+
+ENVELOPE_RATE = 1000  # Envelope values per second, claps and beats need about 1 ms of resolution
+MODES = ('peak', 'rms', 'energy')
+
+
+def block_envelope(samples, factor, mode='peak'):
+    """
+    Envelope of samples with one value per bin of factor samples, and the offset of
+    the loudest sample of each bin, so peaks found in the envelope can be placed to
+    the sample. len(samples) must be a multiple of factor.
+
+    :param mode: 'peak' (largest magnitude, |x| > threshold holds for a bin exactly when
+        it holds for one of its samples), 'rms' or 'energy' (mean square)
+    """
+    bins = samples.reshape(-1, factor)
+    magnitude = np.abs(bins)
+    loudest = magnitude.argmax(axis=1)
+    if mode == 'peak':
+        values = np.take_along_axis(magnitude, loudest[:, None], axis=1)[:, 0]
+    elif mode in ('rms', 'energy'):
+        values = np.einsum('ij,ij->i', bins, bins) / factor
+        if mode == 'rms':
+            values = np.sqrt(values)
+    else:
+        raise ValueError(f"Unknown envelope mode {mode}, expected one of {MODES}")
+    return values, np.arange(len(bins)) * factor + loudest
+
+
+class EnvelopeFrontEnd:
+    """
+    Turns consecutive blocks of raw audio into its envelope at about rate values per
+    second, carrying the samples of an unfinished bin over to the next block. Bins
+    start at multiples of factor in the original sample positions, and every value
+    comes with the position of its loudest sample.
+    """
+
+    def __init__(self, sample_rate=48000, rate=ENVELOPE_RATE, mode='peak'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown envelope mode {mode}, expected one of {MODES}")
+        self.factor = max(1, round(sample_rate / rate))
+        self.rate = sample_rate / self.factor  # Exact envelope rate
+        self.mode = mode
+        self.position = 0  # Position of the next raw sample
+        self._pending = np.empty(self.factor, dtype=np.float32)  # Samples of the unfinished bin
+        self._pending_count = 0
+
+    @property
+    def bins(self):
+        """Number of envelope values produced, or index of the next one"""
+        return (self.position - self._pending_count) // self.factor
+
+    def pending(self):
+        """Envelope value of the unfinished bin as far as it goes, None when it is empty"""
+        if not self._pending_count:
+            return None
+        values, _ = block_envelope(self._pending[:self._pending_count], self._pending_count, self.mode)
+        return values[0]
+
+    def reset(self, position):
+        """
+        Drop the unfinished bin and go on with the first bin starting at or after
+        position. Returns where the next raw samples must start.
+        """
+        self.position = -(-position // self.factor) * self.factor
+        self._pending_count = 0
+        return self.position
+
+    def process(self, samples):
+        """
+        Envelope values of the bins samples complete, samples following the ones of the
+        previous call, and the positions of their loudest samples
+        """
+        self.position += len(samples)
+        if self._pending_count:
+            samples = np.concatenate((self._pending[:self._pending_count], samples))
+        start = self.position - len(samples)
+        whole = len(samples) // self.factor * self.factor
+        self._pending_count = len(samples) - whole
+        self._pending[:self._pending_count] = samples[whole:]
+        values, offsets = block_envelope(samples[:whole], self.factor, self.mode)
+        return values, start + offsets
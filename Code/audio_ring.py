@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class AudioRing:
+    """
+    Ring buffer of mono audio samples written by one thread (the PortAudio callback)
+    and read by one other (a detector), without locks.
+
+    write() copies only the new samples. Positions count every sample ever written,
+    so a reader can tell where a sample was in the stream. Readers copy the samples
+    out, then check the writer's sequence counter: it holds the end of the samples
+    being written, set before the slots are overwritten, so a copy whose oldest
+    sample may have been overwritten meanwhile is retried. Python makes the counter
+    updates atomic and ordered, the copies themselves never block the callback.
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._sequence = 0  # End position of the samples the writer is writing, set first
+        self._written = 0  # End position of the samples written, set last
+        self._cleared = 0  # Samples before this position read as zeros, owned by the reader
+
+    @property
+    def written(self):
+        """Number of samples written since the buffer was created"""
+        return self._written
+
+    def write(self, samples):
+        """Append samples. Producer thread only."""
+        start = self._written
+        if len(samples) > self.capacity:
+            start += len(samples) - self.capacity  # Older ones would be overwritten at once
+            samples = samples[-self.capacity:]
+        end = start + len(samples)
+        self._sequence = end
+        i = start % self.capacity
+        first = min(len(samples), self.capacity - i)
+        self._data[i:i + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._written = end
+
+    def read(self, n, out=None):
+        """The latest n samples, zeros before the first one written or the last clear()"""
+        samples, _ = self.read_from(self._written - n, out)
+        return samples
+
+    def read_from(self, start, out=None):
+        """
+        Samples from position start up to the latest one, and the position of the first
+        one returned, none when start is not written yet. Positions before the first
+        sample written or the last clear() read as zeros, positions older than capacity
+        samples are skipped. out, if given, must hold capacity samples; the result is
+        a view of it.
+        """
+        if out is None:
+            out = np.empty(self.capacity, dtype=self._data.dtype)
+        while True:
+            end = self._written
+            start = max(start, end - self.capacity)
+            if start >= end:
+                return out[:0], start
+            count = end - start
+            # Zeros up to the first sample there is, then the ring from there on
+            first = min(max(self._cleared, 0), end) - start
+            out[:max(first, 0)] = 0
+            begin = max(start, self._cleared, 0)
+            i = begin % self.capacity
+            size = end - begin
+            head = min(size, self.capacity - i)
+            offset = begin - start
+            out[offset:offset + head] = self._data[i:i + head]
+            out[offset + head:count] = self._data[:size - head]
+            if self._sequence - begin <= self.capacity:
+                return out[:count], start
+            start = self._sequence - self.capacity  # Overwritten while copied, skip what was lost
+
+    def clear(self):
+        """Make the samples written so far read as zeros. Consumer thread only."""
+        self._cleared = self._written
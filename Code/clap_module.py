@@ -3,6 +3,42 @@ import sounddevice as sd
 from scipy.ndimage import gaussian_filter1d
 import scipy.signal
 import time
+import copy
+from collections import deque
+from audio_ring import AudioRing
+from audio_envelope import EnvelopeFrontEnd, ENVELOPE_RATE
+
+
+class PeakTracker:
+    """
+    Local maxima of a signal given block by block, found like scipy.signal.find_peaks
+    (without distance) finds them in the whole signal: a peak is a sample, or the
+    middle of a run of equal samples, higher than the samples on both sides. Only
+    the run the last block ended in is carried over, so each block costs O(block).
+    """
+
+    def __init__(self, position=0):
+        self.reset(position)
+
+    def reset(self, position, value=0.0):
+        """Start again as if the signal had been value (never a peak) up to position"""
+        self._value = value  # Value of the run the last block ended in
+        self._run_start = position - 1  # Position of its first sample
+        self._rising = False  # Whether the sample before that run was lower
+        self.position = position  # Position of the next sample
+
+    def update(self, block):
+        """Positions of the peaks completed by the next samples of the signal"""
+        values = np.concatenate(([self._value], block))
+        change = np.flatnonzero(values[1:] != values[:-1]) + 1
+        run_values = np.concatenate(([self._value], values[change]))
+        run_starts = np.concatenate(([self._run_start], self.position - 1 + change))
+        rising = np.concatenate(([self._rising], run_values[1:] > run_values[:-1]))
+        peaks = rising[:-1] & (run_values[1:] < run_values[:-1])
+        self._value, self._run_start, self._rising = run_values[-1], run_starts[-1], rising[-1]
+        self.position += len(block)
+        return (run_starts[:-1][peaks] + run_starts[1:][peaks] - 1) // 2
+
 
 class ClapDetector:
     def __init__(self,
@@ -11,7 +47,9 @@ class ClapDetector:
                  min_clap_duration=0.08,
                  max_double_clap_gap=1.0,
                  word_length=4,
-                 gaussian_sigma=4):
+                 gaussian_sigma=4,
+                 streaming=True,
+                 envelope_rate=ENVELOPE_RATE):
         # Parameters
         self.sample_rate = sample_rate
         self.threshold = threshold
@@ -25,7 +63,21 @@ class ClapDetector:
 
         # Circular buffer to store recent audio samples
         self.buffer_size = int(sample_rate * 1)  # Store 1 second of audio
-        self.audio_buffer = np.zeros(self.buffer_size)
+        self.audio = AudioRing(self.buffer_size)  # Written by the audio callback only
+        self.audio_buffer = np.zeros(self.buffer_size, dtype=np.float32)  # Last snapshot of audio
+
+        # Streaming detection looks at each sample once instead of at the whole second every
+        # poll, and works on the peak envelope at envelope_rate instead of the raw samples
+        self.streaming = streaming
+        self.envelope = EnvelopeFrontEnd(sample_rate, envelope_rate)
+        # In envelope values: at 1 kHz the default 4 samples is far below one value, the
+        # radius is then 0 and the envelope bins do all the smoothing
+        self.smoothing_sigma = gaussian_sigma / self.envelope.factor
+        self.smoothing_radius = int(4.0 * self.smoothing_sigma + 0.5)  # gaussian_filter1d's default truncate
+        self.smoothing_context = np.zeros(2 * self.smoothing_radius, dtype=np.float32)  # Last thresholded values
+        self.peak_tracker = PeakTracker(-self.smoothing_radius)  # Peaks of the smoothed envelope, which lags by smoothing_radius
+        self.window_peaks = deque()  # Envelope indices of the peaks still in the 1 second window
+        self.window_maxima = deque()  # (end index, maximum of the smoothed envelope) of each block in the window
 
         # Global state for clap detection
         # self.listening_for_word = False
@@ -43,14 +95,7 @@ class ClapDetector:
 
     def audio_callback(self, indata, frames, time_info, status):
         """Callback function to continuously capture audio."""
-        # Ensure we handle the case where frames might exceed the buffer size
-        frames_to_use = min(frames, self.buffer_size)
-
-        # Shift the buffer left by the number of frames
-        self.audio_buffer[:-frames_to_use] = self.audio_buffer[frames_to_use:]
-
-        # Append the new audio data to the end of the buffer
-        self.audio_buffer[-frames_to_use:] = indata[:frames_to_use, 0]  # Mono channel
+        self.audio.write(indata[:frames, 0])  # Mono channel
 
     def set_waiting_second_clap_event_callback(self, callback):
         """ Set the callback function to trigger when first clap happens and 
@@ -76,7 +121,12 @@ class ClapDetector:
 
         try:
             while True:
-                if self.detect_claps(self.audio_buffer):
+                if self.streaming:
+                    first_clap = self.detect_new_claps()
+                else:
+                    self.audio.read(self.buffer_size, out=self.audio_buffer)
+                    first_clap = self.detect_claps(self.audio_buffer)
+                if first_clap:
                     print("Waiting for the next symbol...")
                     if self.waiting_second_clap_event_callback:
                         try:
@@ -121,45 +171,111 @@ class ClapDetector:
 
         #peaks, _ = scipy.signal.find_peaks(audio_data, height=self.threshold, distance=int(self.min_clap_duration * self.sample_rate))
         peaks, smoothed_signal = self.process_audio_window()
+        if len(peaks) == 0:
+            return False
+        return self.handle_peaks(np.abs(smoothed_signal).max())
 
-        if len(peaks) > 0:
-            current_time = time.time()
+    def detect_new_claps(self):
+        """
+        Streaming detect_claps: threshold, smooth and search for peaks only the envelope
+        of the samples that arrived since the last call, carrying the smoothing context
+        and the peak search over, and keep what detect_claps needs of the last second:
+        the peaks and the maximum of each block.
+        """
+        radius = self.smoothing_radius
+        position = self.envelope.position  # Next raw sample to read
+        samples, start = self.audio.read_from(position, out=self.audio_buffer)
+        if start != position:
+            # More than a second behind, the samples in between are gone
+            samples = samples[self.envelope.reset(start) - start:]
+            self.smoothing_context.fill(0)
+            self.peak_tracker.reset(self.envelope.bins - radius)
+        values, _ = self.envelope.process(samples)
+        if len(samples) == 0:
+            return False
+        if len(values):
+            signal = np.concatenate((self.smoothing_context, self.apply_threshold(values)))
+            self.smoothing_context[:] = signal[len(signal) - 2 * radius:]
+            # Values of a block are smoothed once the ones radius after them have arrived
+            smoothed_signal = gaussian_filter1d(signal, sigma=self.smoothing_sigma)[radius:radius + len(values)]
+            self.window_peaks.extend(self.peak_tracker.update(smoothed_signal))
+            self.window_maxima.append((self.peak_tracker.position, smoothed_signal.max()))
 
-            if self.waiting_for_second_clap:
-                # Check for cases where the sound buffer was not cleared
-                self.second_clap_maximum = np.abs(smoothed_signal).max()
+        # Like detect_claps, peaks on the first value of the window do not count
+        window_start = (self.envelope.position - self.buffer_size) // self.envelope.factor
+        while self.window_peaks and self.window_peaks[0] <= window_start:
+            self.window_peaks.popleft()
+        while self.window_maxima and self.window_maxima[0][0] <= window_start:
+            self.window_maxima.popleft()
+        tail_peak, tail_maximum = self.tail_peaks()
+        if not self.window_peaks and not tail_peak:
+            return False
+        return self.handle_peaks(max([tail_maximum] + [maximum for _, maximum in self.window_maxima]))
 
-                if (self.last_clap_maximum == self.second_clap_maximum):
-                    # Avoiding fake 'echoes'
-                    print("Fake echo detected! Ignoring second clap.")
-                else:
-                    print(f"Double Clap Detected!")
-                    self.current_word.append('D')  # 'D' for double clap
-                    self.waiting_for_second_clap = False
-                    self.clear_audio_buffer()
+    def tail_peaks(self):
+        """
+        Whether the newest samples, which the streaming state has not settled yet, hold
+        a peak for this poll, and their largest smoothed value. detect_claps smooths the
+        end of its window against its mirror image, which is done here on a copy of the
+        state: the last values, not smoothed yet, and the unfinished envelope bin. A bin
+        stands for up to factor samples, at full rate the signal rising in it would
+        have peaked already, so the envelope is taken to fall after it.
+        """
+        radius = self.smoothing_radius
+        pending = self.envelope.pending()
+        tail = self.smoothing_context
+        if pending is not None:
+            tail = np.append(tail, self.apply_threshold(np.float32(pending)))
+        smoothed_tail = tail[:0]
+        if len(tail) > radius:
+            smoothed_tail = gaussian_filter1d(tail, sigma=self.smoothing_sigma, mode='reflect')[radius:]
+        maximum = smoothed_tail.max(initial=0.0)
+        if self.envelope.factor > 1:
+            smoothed_tail = np.append(smoothed_tail, 0.0)
+        tracker = copy.copy(self.peak_tracker)
+        return len(tracker.update(smoothed_tail)) > 0, maximum
 
-                    if self.clap_completed_event_callback:
-                        try:
-                            self.clap_completed_event_callback('D')
-                        except Exception as e:
-                            print(f"Exception (ignored) while calling callback clap_completed_event_callback: {e}")
-                    # Check if the word is complete
-                    if len(self.current_word) >= self.word_length:
-                        self.print_word_and_reset()
-                    return False
+    def handle_peaks(self, maximum):
+        """
+        Build the word from peaks found in the last second, whose smoothed signal peaked
+        at maximum. Returns whether a first clap was heard.
+        """
+        current_time = time.time()
+
+        if self.waiting_for_second_clap:
+            # Check for cases where the sound buffer was not cleared
+            self.second_clap_maximum = maximum
+
+            if (self.last_clap_maximum == self.second_clap_maximum):
+                # Avoiding fake 'echoes'
+                print("Fake echo detected! Ignoring second clap.")
             else:
-                # First clap detected, now wait for potential second clap
-                self.first_clap_maximum = np.abs(smoothed_signal).max()
-                if self.last_clap_maximum == self.first_clap_maximum:
-                    print(f"Echo First Clap Detected, ignoring...")
-                    return False
-                print(f"First Clap Detected, waiting for potential second clap...")
-                self.first_clap_time = current_time
-                self.waiting_for_second_clap = True
+                print(f"Double Clap Detected!")
+                self.current_word.append('D')  # 'D' for double clap
+                self.waiting_for_second_clap = False
                 self.clear_audio_buffer()
-                self.last_clap_maximum = self.first_clap_maximum
-                return True
 
+                if self.clap_completed_event_callback:
+                    try:
+                        self.clap_completed_event_callback('D')
+                    except Exception as e:
+                        print(f"Exception (ignored) while calling callback clap_completed_event_callback: {e}")
+                # Check if the word is complete
+                if len(self.current_word) >= self.word_length:
+                    self.print_word_and_reset()
+                return False
+        else:
+            # First clap detected, now wait for potential second clap
+            self.first_clap_maximum = maximum
+            if self.last_clap_maximum == self.first_clap_maximum:
+                print(f"Echo First Clap Detected, ignoring...")
+                return False
+            print(f"First Clap Detected, waiting for potential second clap...")
+            self.first_clap_time = current_time
+            self.waiting_for_second_clap = True
+            self.clear_audio_buffer()
+            self.last_clap_maximum = self.first_clap_maximum
+            return True
         return False
 
     def check_for_double_clap_timeout(self):
@@ -197,5 +313,12 @@ class ClapDetector:
 
     def clear_audio_buffer(self):
         """ Clear the audio buffer after processing a clap to avoid repeated detection """
-        self.audio_buffer = np.zeros(self.buffer_size)
+        self.audio.clear()
+        self.audio_buffer.fill(0)
+        # The streaming state restarts from silence at the next envelope bin
+        self.envelope.reset(self.envelope.position)
+        self.smoothing_context.fill(0)
+        self.peak_tracker.reset(self.envelope.bins - self.smoothing_radius)
+        self.window_peaks.clear()
+        self.window_maxima.clear()
 
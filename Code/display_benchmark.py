@@ -0,0 +1,181 @@
+"""
+Display throughput benchmark.
+
+Plays every emotion of Code/emotions through every LCD driver and measures, for
+each frame, how long the image takes to decode and to convert to the panel's
+RGB565, how many bytes go over SPI and how long that takes. By default the panels
+are simulated with lib.virtual_lcd and the SPI time is modeled at --spi_freq; with
+--hardware the connected panel, whose single driver --drivers must name, is driven
+and the SPI time is measured. The frame rate is then timed over the whole loop; in
+simulation it is estimated from the per-frame times. Results are written as JSON
+so that runs can be compared.
+
+    python display_benchmark.py --drivers LCD_2inch LCD_1inch28 --output before.json
+    python display_benchmark.py --hardware --drivers LCD_2inch --output pi.json
+"""
+import time
+import json
+import argparse
+import platform
+import importlib
+from PIL import Image
+import emotion_pack
+from lib import rgb565, virtual_lcd
+
+DRIVERS = ['LCD_0inch96', 'LCD_1inch14', 'LCD_1inch28', 'LCD_1inch3', 'LCD_1inch47',
+           'LCD_1inch54', 'LCD_1inch8', 'LCD_2inch', 'LCD_2inch4']
+
+
+def create_display(driver, hardware=False, spi_freq=40000000, rgb444=False):
+    """Return an initialized driver instance and its VirtualBus (None on hardware)"""
+    driver_class = getattr(importlib.import_module('lib.' + driver), driver)
+    if hardware:
+        disp, bus = driver_class(spi_freq=spi_freq, rgb444=rgb444), None
+    else:
+        bus = virtual_lcd.VirtualBus()
+        disp = driver_class(spi=bus.spi, gpio=bus.gpio, spi_freq=spi_freq, rgb444=rgb444)
+    disp.Init()
+    return disp, bus
+
+
+def frame_size(disp):
+    """(width, height) of the frames sent to a display, landscape when it can rotate"""
+    if disp.MADCTL_LANDSCAPE is not None:
+        return disp.height, disp.width
+    return disp.width, disp.height
+
+
+def benchmark_emotion(disp, bus, emotion, image_dir=emotion_pack.EMOTIONS_DIR, delta=False):
+    """
+    Show every frame of an emotion as fast as possible
+
+    :param delta: Only send the regions that changed since the previous frame
+    :return: A dict with a summary and per-frame measurements (times in milliseconds)
+    """
+    width, height = frame_size(disp)
+    landscape = (width, height) != (disp.width, disp.height)
+    frames = []
+    previous = None
+    loop_start = time.perf_counter()
+    for filename in emotion_pack.list_frames(emotion, image_dir):
+        start = time.perf_counter()
+        with Image.open(filename) as image:
+            image = image.convert('RGB')
+        decoded = time.perf_counter()
+        if image.size != (width, height):
+            image = image.resize((width, height))
+        frame = rgb565.from_rgb888(image)
+        converted = time.perf_counter()
+
+        rects = rgb565.dirty_rects(previous, frame) if delta and previous is not None else None
+        bus_time, bus_bytes = (bus.spi.bus_time, bus.spi.bytes_written) if bus else (0, 0)
+        if rects is None:
+            disp.ShowBuffer(frame, landscape)
+            pixels = frame.size
+        else:
+            for rect in rects:
+                disp.ShowRegion(frame, rect, landscape)
+            pixels = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+        written = time.perf_counter()
+        previous = frame
+
+        if bus:
+            # Modeled bus time, the virtual panel's own bookkeeping is not counted
+            spi_time = bus.spi.bus_time - bus_time
+            nbytes = bus.spi.bytes_written - bus_bytes
+        else:
+            spi_time = written - converted
+            nbytes = (3 * pixels + 1) // 2 if disp.rgb444 else 2 * pixels  # Pixel data only
+        frames.append({
+            'decode_ms': (decoded - start) * 1000,
+            'convert_ms': (converted - decoded) * 1000,
+            'bytes': nbytes,
+            'spi_ms': spi_time * 1000,
+        })
+    loop_ms = (time.perf_counter() - loop_start) * 1000
+
+    if bus:
+        # The virtual panel's own time is not SPI time, estimate from the modeled bus instead
+        total_ms = sum(f['decode_ms'] + f['convert_ms'] + f['spi_ms'] for f in frames)
+    else:
+        total_ms = loop_ms
+    spi_ms = sum(f['spi_ms'] for f in frames)
+    count = len(frames)
+    summary = {
+        'frames': count,
+        'decode_ms': sum(f['decode_ms'] for f in frames) / count if count else 0.0,
+        'convert_ms': sum(f['convert_ms'] for f in frames) / count if count else 0.0,
+        'bytes': sum(f['bytes'] for f in frames),
+        'spi_ms': spi_ms / count if count else 0.0,
+        'fps': count * 1000 / total_ms if total_ms else 0.0,
+        'fps_estimated': bus is not None,  # Measured over the loop on hardware
+        # Estimated rate once frames come pre-converted from a pack, bounded by SPI alone
+        'spi_fps': count * 1000 / spi_ms if spi_ms else 0.0,
+    }
+    return {'summary': summary, 'frames': frames}
+
+
+def run(drivers=DRIVERS, emotions=None, image_dir=emotion_pack.EMOTIONS_DIR, hardware=False,
+        spi_freq=40000000, delta=False, rgb444=False):
+    """
+    Benchmark emotions (all by default) on drivers, returning the JSON-ready results.
+    On hardware drivers must name the one driver of the connected panel.
+    """
+    if hardware and len(drivers) != 1:
+        raise ValueError(f"Only the connected panel can be driven, got drivers {list(drivers)}")
+    emotions = emotions or emotion_pack.list_emotions(image_dir)
+    results = {
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'hardware': hardware,
+        'spi_freq': spi_freq,
+        'delta': delta,
+        'rgb444': rgb444,
+        'drivers': {},
+    }
+    for driver in drivers:
+        try:
+            disp, bus = create_display(driver, hardware, spi_freq, rgb444)
+        except ValueError as e:
+            print(f"Skipping {driver}: {e}")
+            continue
+        width, height = frame_size(disp)
+        results['drivers'][driver] = {'width': width, 'height': height, 'emotions': {}}
+        for emotion in emotions:
+            result = benchmark_emotion(disp, bus, emotion, image_dir, delta)
+            results['drivers'][driver]['emotions'][emotion] = result
+            summary = result['summary']
+            print(f"{driver:12} {emotion:10} {summary['frames']:4} frames "
+                  f"decode {summary['decode_ms']:6.2f} ms  convert {summary['convert_ms']:6.2f} ms  "
+                  f"spi {summary['spi_ms']:6.2f} ms  {summary['fps']:6.1f} fps"
+                  f"{' est.' if summary['fps_estimated'] else ''} "
+                  f"({summary['spi_fps']:.1f} est. from packs)")
+        if bus:
+            # Pixels addressed outside the controller RAM point at a wrong window in the driver
+            results['drivers'][driver]['pixels_clipped'] = bus.panel.pixels_clipped
+        if hardware:
+            disp.module_exit()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure display throughput per LCD driver and emotion.")
+    parser.add_argument("--drivers", nargs='*', help="LCD driver modules to benchmark, default is all of them. "
+                                                      "With --hardware exactly one, the connected panel's.")
+    parser.add_argument("--emotions", nargs='*', help="Emotions to play, default is all of them.")
+    parser.add_argument("--image_dir", default=emotion_pack.EMOTIONS_DIR, help="Directory holding the emotion folders.")
+    parser.add_argument("--hardware", action='store_true', help="Drive the connected panel instead of a simulated one.")
+    parser.add_argument("--spi_freq", type=int, default=40000000, help="SPI clock in Hz.")
+    parser.add_argument("--delta", action='store_true', help="Only send the regions that changed.")
+    parser.add_argument("--rgb444", action='store_true', help="Send 12-bit pixels on the drivers that support it.")
+    parser.add_argument("--output", default='display_benchmark.json', help="JSON file for the results.")
+    args = parser.parse_args()
+    if args.hardware and (args.drivers is None or len(args.drivers) != 1):
+        parser.error("--hardware needs exactly one --drivers value, the driver of the connected panel")
+
+    results = run(args.drivers or DRIVERS, args.emotions, args.image_dir, args.hardware, args.spi_freq, args.delta, args.rgb444)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}")
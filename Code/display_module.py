@@ -1,93 +1,148 @@
-import os
-import threading
-import logging
-from lib import LCD_2inch
-from PIL import Image
 import time
+import numpy as np
+import display_renderer
 
-# Frame counts for various emotions or animations
-frame_count = {
-  'player': 10, 'cabana': 4, 'slime': 10, 'blink': 39, 'happy': 45,
-  'sad': 47, 'dizzy': 67, 'excited': 24, 'neutral': 61, 'happy2': 20,
-  'angry': 20, 'happy3': 26, 'bootup3': 124, 'blink2': 20,
-  'rat': 50
-}
-
-display_lock = threading.Lock()
 
 class DisplayControl:
-    def __init__(self):
-        """Initialize the LCD display and variables for controlling animations"""
-        self.disp = LCD_2inch.LCD_2inch()
-        self.disp.Init()
-        self.image_dir = '/home/pi/Emo/Code/emotions/'
-        self.current_emotion = None
-        self.animation_thread = None
-        self.stop_animation_flag = False
+    """
+    Controls the face shown on the LCD. The panel itself is driven by an Animator
+    running in the display renderer process; this class only sends it commands,
+    so every method returns as soon as the command is queued, raising the errors
+    the Animator raised for it.
+    """
+
+    def __init__(self, in_process=False, **animator_kwargs):
+        """
+        :param in_process: Run the Animator on a thread of this process instead
+        :param animator_kwargs: Passed on to Animator (disp, delta, emotion_fps, cache_bytes, transition,
+            transition_frames, boot, first_frame_budget, dual_eyes, idle_after, idle_fps, idle_backlight)
+        """
+        # The first frame budget of the boot emotion counts from here
+        animator_kwargs.setdefault('started', time.monotonic())
+        if in_process:
+            from animator import Animator
+            self._animator = Animator(**animator_kwargs)
+            self._renderer = None
+        else:
+            self._animator = None
+            self._renderer = display_renderer.RendererProcess(animator_kwargs)
+
+    def _call(self, name, *args):
+        if self._renderer is not None:
+            return self._renderer.call(name, *args)
+        return getattr(self._animator, name)(*args)
+
+    @property
+    def current_emotion(self):
+        return self.stats()['current_emotion']
 
     def display_neutral(self):
-        self.show('neutral', -1)  # Show 'neutral' indefinitely
+        self.set_idle('neutral')  # Show 'neutral' whenever nothing else is playing
+        self.stop_animation()
 
     def display_face_and_return_to_neutral(self, face):
-        # Show the 'happy' face, interrupt any current animation, then return to 'neutral'
-        with display_lock:
-            self.show(face, 1, stop_now=True)  # Show 'dizzy' face once
-            self.display_neutral()  # Go back to 'neutral' afterward
+        # Show the face once, interrupting any current animation, then return to 'neutral'
+        self.set_idle('neutral')
+        self.play(face, 1, interrupt=True)
 
-    
     def show(self, emotion, count=-1, stop_now=False):
         """
-        Display the emotion animation on the LCD screen in a separate thread.
+        Display the emotion animation on the LCD screen.
 
-        :param emotion: Emotion name (string)
+        :param emotion: Emotion name (string), a frames folder or a procedural face of face_renderer.EMOTIONS
         :param count: How many times to loop through the frames (-1 for infinite)
+        :param stop_now: Interrupt the current animation instead of letting its loop finish
+        """
+        self.play(emotion, count, interrupt=stop_now)
+
+    def play(self, emotion, loops=1, interrupt=False):
+        """
+        Replace whatever is playing or queued by an emotion.
+
+        :param loops: How many times to loop through the frames (-1 for infinite)
+        :param interrupt: Switch at the next frame instead of at the end of the current loop
         """
-        # Stop the current animation if one is running
-        if self.animation_thread and self.animation_thread.is_alive():
-            self.stop_animation(stop_now=stop_now)
+        self._call('play', emotion, loops, interrupt)
+
+    def play_for(self, emotion, duration, loops=1, interrupt=True):
+        """Play an emotion stretched or squeezed to last exactly duration seconds"""
+        self._call('play_for', emotion, duration, loops, interrupt)
 
-        # Start a new animation in a background thread
-        self.stop_animation_flag = False
-        self.stop_now_animation_flag = False
-        self.current_emotion = emotion
-        self.animation_thread = threading.Thread(target=self._play_animation, args=(emotion, count))
-        self.animation_thread.start()
+    def stream(self, emotion):
+        """Play an emotion once, starting before it is fully decoded, like the boot animation"""
+        self._call('stream', emotion)
+
+    def enqueue_next(self, emotion, loops=1):
+        """Play an emotion after the ones already queued"""
+        self._call('enqueue_next', emotion, loops)
+
+    def interrupt(self):
+        """Drop the queued emotions and stop the current one at the next frame"""
+        self._call('interrupt')
+
+    def set_idle(self, emotion):
+        """Emotion looped whenever nothing else is playing, None to keep the last frame"""
+        self._call('set_idle', emotion)
 
     def stop_animation(self, stop_now=False):
-        """Set the flag to stop the current animation and wait for the thread to finish"""
-        if stop_now:
-            self.stop_now_animation_flag = True
+        """Stop the current animation (at the end of its loop unless stop_now) and clear the queue"""
+        self._call('stop_animation', stop_now)
+
+    def set_transition(self, transition, frames=4):
+        """Cross-fade ('fade') or wipe ('wipe') over frames frames when the emotion changes, None to cut"""
+        self._call('set_transition', transition, frames)
+
+    def set_overlay_text(self, name, text, x=4, y=4, color=(255, 255, 255)):
+        """
+        Show status text over the face, e.g. set_overlay_text('bpm', '120 BPM'), until it
+        is replaced or cleared. Negative x or y count from the right or bottom edge.
+        """
+        self._call('set_overlay_text', name, text, x, y, color)
+
+    def set_overlay_icon(self, name, icon, x=4, y=4, color=(255, 255, 255)):
+        """Show an icon ('up', 'down', 'note' or 'dot') over the face, see set_overlay_text"""
+        self._call('set_overlay_icon', name, icon, x, y, color)
+
+    def clear_overlay(self, name=None):
+        """Remove one overlay item, or all of them"""
+        self._call('clear_overlay', name)
+
+    def set_gaze(self, x, y=0):
+        """
+        Move the face x pixels right and y pixels down to look at someone, (0, 0) to
+        center it. Horizontal moves on the 2 inch panel only scroll it, a few bytes of SPI.
+        """
+        self._call('set_gaze', x, y)
+
+    def notify_event(self):
+        """
+        Report an interaction (a person seen, a clap...). After idle_after seconds without
+        one the face runs at a lower frame rate with the backlight dimmed.
+        """
+        self._call('notify_event')
+
+    def prefetch(self, emotions):
+        """Decode emotions in the background because they are about to be played"""
+        self._call('prefetch', emotions)
+
+    def show_frame(self, frame):
+        """Show a (h, w) big-endian RGB565 frame until the next command"""
+        if self._renderer is not None:
+            self._renderer.show_frame(frame)
         else:
-            self.stop_animation_flag = True
-        if self.animation_thread:
-            self.animation_thread.join()
-
-    def _play_animation(self, emotion, count):
-        """Private function to play an emotion animation frame by frame"""
-        i = 0
-        while (count < 0) or (i < count):
-            time.sleep(0.1)
-            if count > 0:
-                i += 1
-            try:
-                for j in range(frame_count[emotion]):
-                    if self.stop_now_animation_flag:
-                        return  # Stop the animation if flagged
-                    for i in [".png", ".jpg"]:
-                        filename = f'{self.image_dir}{emotion}/frame{j}{i}'
-                        if os.path.exists(filename):
-                          break
-                    image = Image.open(filename)
-                    self.disp.ShowImage(image)
-                if self.stop_animation_flag:
-                    return  # Stop the animation if flagged
-            except IOError as e:
-                logging.error(f"Error showing emotion {emotion}: {e}")
-            except KeyboardInterrupt:
-                self.disp.module_exit()
-                logging.info("Program interrupted, exiting.")
-                exit()
+            self._animator.show_frame(np.array(frame, dtype='>u2'))
 
     def clear(self):
         """Clear the display"""
-        self.disp.clear()
+        self._call('clear')
+
+    def stats(self):
+        """Playback counters of the animator, including frame cache hit rates"""
+        return self._call('stats')
+
+    def close(self):
+        """Stop the animator, and the renderer process if there is one"""
+        if self._renderer is not None:
+            self._renderer.close()
+        else:
+            self._animator.close()
@@ -0,0 +1,138 @@
+"""
+Display renderer process.
+
+The renderer owns the SPI device and the DC/RST GPIO pins and runs an Animator
+in its own interpreter, so animations no longer stutter while camera inference
+or clap detection hold the GIL. DisplayControl sends it commands over a pipe and
+hands over raw frames through shared memory slots, without pickling the pixels.
+
+The renderer is forked, so DisplayControl must be created before the robot scripts
+import camera, audio or inference modules or start threads: a fork copies the locks
+other threads hold, which never get released in the child.
+
+Every call waits for the renderer to take the command (the Animator methods only
+queue it) and re-raises its error. If the renderer dies, calls are dropped with an
+error logged once, instead of failing the camera and audio threads that send them.
+"""
+import logging
+import pickle
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+FRAME_SHAPE = (240, 320)  # Frames of the 2 inch panel, landscape or, transposed, portrait
+FRAME_SLOTS = 2
+SLOT_TIMEOUT = 1.0  # Seconds show_frame waits for the renderer to free a frame slot
+
+
+class RendererProcess:
+    """Client-side handle of the renderer process"""
+
+    def __init__(self, animator_kwargs=None, frame_shape=FRAME_SHAPE, slots=FRAME_SLOTS):
+        # fork, because spawn and forkserver would re-run the top level of the robot scripts in the child
+        if threading.active_count() > 1:
+            logging.warning("Forking the display renderer while other threads run, "
+                            "create DisplayControl before starting them")
+        ctx = multiprocessing.get_context('fork')
+        self.frame_shape = tuple(frame_shape)
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * frame_shape[0] * frame_shape[1] * 2)
+        # Flat slots, viewed in the orientation of each frame
+        self.frames = np.ndarray((slots, frame_shape[0] * frame_shape[1]), dtype='>u2', buffer=self._shm.buf)
+        self._free_slots = ctx.Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+        self._conn, child_conn = ctx.Pipe()
+        self._lock = threading.Lock()  # Callers live on several threads
+        self._dead = False  # Set once the renderer is gone, calls are dropped from then on
+        self.process = ctx.Process(target=_serve, name='display-renderer', daemon=True,
+                                   args=(child_conn, self.frames, self._free_slots, animator_kwargs or {}))
+        self.process.start()
+        child_conn.close()
+
+    def call(self, name, *args):
+        """
+        Run an Animator method in the renderer and return its result, re-raising its
+        error. Returns None without doing anything once the renderer is gone.
+        """
+        with self._lock:
+            if self._dead:
+                return None
+            try:
+                if not self.process.is_alive():
+                    raise EOFError
+                self._conn.send((name, args))
+                ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                self._dead = True
+                logging.error(f"The display renderer is gone (exit code {self.process.exitcode}), "
+                              f"display commands are ignored")
+                return None
+        if not ok:
+            raise result
+        return result
+
+    def show_frame(self, frame):
+        """
+        Copy a (h, w) RGB565 frame, of frame_shape or transposed like the Animator
+        takes it, into a free shared slot and have the renderer show it. The frame is
+        dropped if no slot is freed within SLOT_TIMEOUT seconds.
+        """
+        shape = np.shape(frame)
+        if shape not in (self.frame_shape, self.frame_shape[::-1]):
+            raise ValueError(f"Frame size {shape[1]}x{shape[0]} does not fit the display" if len(shape) == 2
+                             else f"Frames must be (h, w) arrays, got shape {shape}")
+        try:
+            slot = self._free_slots.get(timeout=0 if self._dead else SLOT_TIMEOUT)
+        except queue.Empty:
+            logging.warning("No free display frame slot, dropping the frame")
+            return
+        try:
+            self.frames[slot].reshape(shape)[...] = frame  # Converted like DisplayControl does in process
+            self.call('show_frame', slot, shape)
+        except BaseException:
+            self._free_slots.put(slot)  # The renderer never got the frame, so never frees the slot
+            raise
+
+    def close(self):
+        self.call('close')
+        self.process.join(timeout=5)
+        del self.frames
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _serve(conn, frames, free_slots, animator_kwargs):
+    """Main function of the renderer process"""
+    # Importing the animator opens the SPI device, so it only happens in this process
+    from animator import Animator
+    animator = Animator(**animator_kwargs)
+    while True:
+        try:
+            name, args = conn.recv()
+        except EOFError:
+            break  # The client process is gone
+        if name == 'close':
+            conn.send((True, None))
+            break
+        try:
+            if name == 'show_frame':
+                slot, shape = args
+                result = animator.show_frame(frames[slot].reshape(shape), release=lambda slot=slot: free_slots.put(slot))
+            else:
+                result = getattr(animator, name)(*args)
+        except Exception as e:
+            conn.send((False, _picklable(e)))  # Raised again by the caller
+        else:
+            conn.send((True, result))
+    animator.close()
+
+
+def _picklable(error):
+    """The error itself if it can be sent to the client, else a RuntimeError describing it"""
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
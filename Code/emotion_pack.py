@@ -0,0 +1,341 @@
+"""
+Precompiled emotion packs.
+
+A pack holds every frame of one emotion already converted to the display's
+big-endian RGB565. The faces use few colors, so frames are normally stored as
+indices into a palette holding every RGB565 color of the emotion, either one
+index per pixel or as runs of indices that never cross a row, or raw, whichever
+is smallest. Indices take 8 bits with up to 256 colors and 16 bits beyond, which
+antialiased edges often need; runs stay small either way. Packs are lossless;
+--max_error builds a palette of the 256 most frequent colors instead, mapping
+the other colors to the nearest one when no channel (0-255) moves further than
+that, and storing the frames where one would raw.
+All integers are little-endian unless noted:
+
+    header   magic 'EMOP', version, width, height, frame count, fps, palette size
+    palette  palette size x big-endian RGB565 color
+    index    frame count x (offset, length, encoding, digest), offsets from the start of the file
+    frames   raw:     RGB565 pixel data
+             indexed: one palette index per pixel
+             runs:    run count x run length (1-255), then run count x palette index
+
+The digest is an 8-byte BLAKE2b hash of the frame's source RGB565 pixels. Frames
+with equal digests are stored once in a pack, sharing their offset, and the frame
+cache keeps a single copy of frames shared by several emotions.
+
+Packs are built offline from the PNG sequences in Code/emotions:
+
+    python emotion_pack.py                  # every emotion
+    python emotion_pack.py happy rat --fps 15
+    python emotion_pack.py --max_error 16   # 8-bit indices, slightly lossy
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+from PIL import Image
+
+from lib import rgb565
+
+EMOTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotions')
+PACK_EXTENSION = '.emo'
+PACK_MAGIC = b'EMOP'
+PACK_VERSION = 4
+PACK_VERSIONS = (3, 4)  # Readable versions, 3 only had palettes of up to 256 colors
+DEFAULT_FPS = 20
+PALETTE_SIZE = 256  # Colors of lossy palettes, one byte per index
+MAX_PALETTE_SIZE = 0xFFFF  # Colors a pack header can hold
+MAX_ERROR = 0  # Largest channel error (0-255) of a palette-mapped pixel, 0 is lossless
+
+# Frame encodings
+ENCODING_RAW = 0
+ENCODING_INDEXED = 1
+ENCODING_RUNS = 2
+
+_HEADER = struct.Struct('<4sHHHHHH')
+_INDEX_ENTRY = struct.Struct('<IIB8s')
+_MAX_RUN = 255
+_FRAME_NAME = re.compile(r'^frame(\d+)\.(png|jpg)$')
+
+
+def pack_path(emotion, image_dir=EMOTIONS_DIR):
+    return os.path.join(image_dir, emotion + PACK_EXTENSION)
+
+
+def list_frames(emotion, image_dir=EMOTIONS_DIR):
+    """Return the frame image files of an emotion ordered by frame number"""
+    emotion_dir = os.path.join(image_dir, emotion)
+    frames = {}
+    for name in os.listdir(emotion_dir):
+        match = _FRAME_NAME.match(name)
+        # A .png wins over a .jpg with the same frame number
+        if match and (match.group(2) == 'png' or int(match.group(1)) not in frames):
+            frames[int(match.group(1))] = os.path.join(emotion_dir, name)
+    return [frames[j] for j in sorted(frames)]
+
+
+def list_emotions(image_dir=EMOTIONS_DIR):
+    """Return the emotions that have a frame directory"""
+    return sorted(name for name in os.listdir(image_dir)
+                  if os.path.isdir(os.path.join(image_dir, name)))
+
+
+def build_palette(frames, size=PALETTE_SIZE):
+    """The size most frequent colors of RGB565 frames (None for all), as a big-endian palette array"""
+    colors, counts = np.unique(np.concatenate([frame.ravel() for frame in frames]), return_counts=True)
+    return colors[np.argsort(-counts, kind='stable')[:size]].astype('>u2')
+
+
+def _to_rgb(colors):
+    colors = colors.astype(np.int32)
+    return np.stack(((colors >> 11) << 3, ((colors >> 5) & 0x3F) << 2, (colors & 0x1F) << 3), axis=-1)
+
+
+def index_dtype(palette_size):
+    """Type of the palette indices stored for a palette of palette_size colors"""
+    return np.dtype(np.uint8) if palette_size <= 256 else np.dtype('<u2')
+
+
+def quantize(frame, palette):
+    """(h, w) indices of the palette colors equal or else nearest to the pixels of an RGB565 frame"""
+    colors, inverse = np.unique(frame, return_inverse=True)
+    order = np.argsort(palette, kind='stable')
+    found = order[np.minimum(np.searchsorted(palette[order], colors), len(palette) - 1)]
+    missing = np.flatnonzero(palette[found] != colors)
+    if len(missing):
+        # Only colors the palette lacks are compared with all of it
+        distances = ((_to_rgb(colors[missing])[:, None, :] - _to_rgb(palette)[None, :, :]) ** 2).sum(axis=-1)
+        found[missing] = distances.argmin(axis=1)
+    return found.astype(index_dtype(len(palette)))[inverse].reshape(frame.shape)
+
+
+def quantization_error(frame, palette, indices):
+    """Largest difference (0-255) of a color channel between a frame and its palette indices"""
+    return int(np.abs(_to_rgb(palette[indices]) - _to_rgb(frame)).max())
+
+
+def encode_runs(indices):
+    """Run lengths and values of (h, w) indices, runs cut at row ends and at 255 pixels"""
+    starts = np.ones(indices.shape, dtype=bool)
+    starts[:, 1:] = indices[:, 1:] != indices[:, :-1]
+    starts[:, ::_MAX_RUN] = True
+    starts = np.flatnonzero(starts)
+    lengths = np.diff(np.append(starts, indices.size)).astype(np.uint8)
+    return lengths, indices.ravel()[starts]
+
+
+def frame_digest(frame):
+    """Content address of an RGB565 frame"""
+    return hashlib.blake2b(frame.astype('>u2').tobytes(), digest_size=8).digest()
+
+
+def encode_frame(frame, palette=None, max_error=MAX_ERROR):
+    """
+    Smallest PackedFrame of an RGB565 frame, raw when there is no palette or when
+    mapping the frame to it would change a color channel by more than max_error
+    """
+    height, width = frame.shape
+    digest = frame_digest(frame)
+    raw = PackedFrame(ENCODING_RAW, frame.astype('>u2').tobytes(), width, height, digest=digest)
+    indices = quantize(frame, palette) if palette is not None else None
+    if indices is None or quantization_error(frame, palette, indices) > max_error:
+        return raw
+    lengths, values = encode_runs(indices)
+    runs = PackedFrame(ENCODING_RUNS, lengths.tobytes() + values.tobytes(), width, height, palette, digest)
+    indexed = PackedFrame(ENCODING_INDEXED, indices.tobytes(), width, height, palette, digest)
+    return min((raw, runs, indexed), key=lambda packed: packed.nbytes)  # Raw on ties, it needs no lookup
+
+
+class PackedFrame:
+    """One frame as stored in a pack, expanded to RGB565 by decode()"""
+
+    def __init__(self, encoding, data, width, height, palette=None, digest=None):
+        self.encoding = encoding
+        self.data = data  # bytes-like, a view of the pack until copied
+        self.shape = (height, width)
+        self.palette = palette
+        self.digest = digest
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def copy(self):
+        """Frame holding its own bytes instead of a view of the pack"""
+        return PackedFrame(self.encoding, bytes(self.data), self.shape[1], self.shape[0], self.palette, self.digest)
+
+    def decode(self, out=None):
+        """Expand into out, a (h, w) big-endian RGB565 array, through the palette lookup table"""
+        if out is None:
+            out = np.empty(self.shape, dtype='>u2')
+        pixels = out.reshape(-1)
+        if self.encoding == ENCODING_RAW:
+            pixels[:] = np.frombuffer(self.data, dtype='>u2')
+        elif self.encoding == ENCODING_INDEXED:
+            np.take(self.palette, np.frombuffer(self.data, dtype=index_dtype(len(self.palette))), out=pixels, mode='clip')
+        else:
+            dtype = index_dtype(len(self.palette))
+            runs = len(self.data) // (1 + dtype.itemsize)
+            lengths = np.frombuffer(self.data, dtype=np.uint8, count=runs)
+            values = np.frombuffer(self.data, dtype=dtype, count=runs, offset=runs)
+            np.take(self.palette, np.repeat(values, lengths), out=pixels, mode='clip')
+        return out
+
+
+class EmotionPack:
+    """Read-only, memory-mapped view of a pack file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, self.frame_count, self.fps, palette_size = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != PACK_MAGIC or version not in PACK_VERSIONS:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {PACK_VERSION} emotion pack")
+        self.palette = np.frombuffer(self._mmap, dtype='>u2', count=palette_size, offset=_HEADER.size).copy()
+        index_start = _HEADER.size + 2 * palette_size
+        self._index = [_INDEX_ENTRY.unpack_from(self._mmap, index_start + j * _INDEX_ENTRY.size)
+                       for j in range(self.frame_count)]
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return self.frame_count
+
+    def frame(self, j):
+        """Frame j as a PackedFrame viewing the pack, without copying"""
+        offset, length, encoding, digest = self._index[j]
+        return PackedFrame(encoding, self._view[offset:offset + length], self.width, self.height,
+                           self.palette, digest)
+
+    def digests(self):
+        """Digest of every frame, in order"""
+        return [entry[3] for entry in self._index]
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+
+def write_pack(path, frames, width, height, fps=DEFAULT_FPS, palette=None):
+    """
+    Write PackedFrames sharing one palette (None if they are all raw) to a pack file.
+    Frames with the same digest are written once.
+    """
+    frames = list(frames)
+    palette = np.asarray(palette if palette is not None else [], dtype='>u2')
+    offset = _HEADER.size + palette.nbytes + len(frames) * _INDEX_ENTRY.size
+    offsets = {}  # digest -> offset of the data already written
+    unique = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, width, height, len(frames), fps, len(palette)))
+        f.write(palette.tobytes())
+        for frame in frames:
+            digest = frame.digest if frame.digest is not None else frame_digest(frame.decode())
+            if digest not in offsets:
+                offsets[digest] = offset
+                offset += frame.nbytes
+                unique.append(frame)
+            f.write(_INDEX_ENTRY.pack(offsets[digest], frame.nbytes, frame.encoding, digest))
+        for frame in unique:
+            f.write(frame.data)
+    os.replace(tmp_path, path)
+
+
+def build_pack(emotion, image_dir=EMOTIONS_DIR, fps=DEFAULT_FPS, raw=False, max_error=MAX_ERROR):
+    """
+    Convert the PNG/JPG frames of an emotion into its pack file. Returns the path,
+    the frame count and how many frames had to be stored raw.
+
+    :param raw: Store every frame as plain RGB565 instead of palette indices
+    :param max_error: Largest channel error (0-255) accepted for frames mapped to a palette
+        of the PALETTE_SIZE most frequent colors, 0 keeps every color
+    """
+    filenames = list_frames(emotion, image_dir)
+    if not filenames:
+        raise ValueError(f"No frames found for emotion {emotion}")
+    frames = []
+    size = None
+    for filename in filenames:
+        with Image.open(filename) as image:
+            image = image.convert('RGB')
+            if size is None:
+                size = image.size
+            elif image.size != size:
+                raise ValueError(f"{filename} is {image.size}, expected {size}")
+            frames.append(rgb565.from_rgb888(image))
+    if raw:
+        palette = None
+    elif max_error:
+        palette = build_palette(frames)
+    else:
+        palette = build_palette(frames, MAX_PALETTE_SIZE)  # Colors past it are stored raw
+    packed = [encode_frame(frame, palette, max_error) for frame in frames]
+    stored_raw = sum(frame.encoding == ENCODING_RAW for frame in packed)
+    if stored_raw == len(packed):
+        palette = None  # Not used by any frame
+    path = pack_path(emotion, image_dir)
+    write_pack(path, packed, size[0], size[1], fps, palette)
+    return path, len(frames), stored_raw
+
+
+def dedup_report(image_dir=EMOTIONS_DIR):
+    """Count the frames and bytes of every pack, and how many are duplicates within or across packs"""
+    frames = unique_in_packs = 0
+    raw_bytes = pack_bytes = 0
+    sizes = {}  # digest -> frame size, over all packs
+    for emotion in list_emotions(image_dir):
+        path = pack_path(emotion, image_dir)
+        if not os.path.exists(path):
+            continue
+        pack = EmotionPack(path)
+        try:
+            in_pack = {}
+            for j, digest in enumerate(pack.digests()):
+                in_pack[digest] = pack.frame(j).nbytes
+                raw_bytes += in_pack[digest]
+        finally:
+            pack.close()
+        frames += len(pack)
+        unique_in_packs += len(in_pack)
+        pack_bytes += sum(in_pack.values())
+        sizes.update(in_pack)
+    return {
+        'frames': frames,
+        'unique_in_packs': unique_in_packs,
+        'unique': len(sizes),
+        'bytes': raw_bytes,  # Without deduplication
+        'pack_bytes': pack_bytes,  # Deduplicated within each pack, as stored
+        'unique_bytes': sum(sizes.values()),  # Deduplicated across packs, as cached
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build RGB565 emotion packs from frame images.")
+    parser.add_argument("emotions", nargs='*', help="Emotions to build, default is all of them.")
+    parser.add_argument("--image_dir", default=EMOTIONS_DIR, help="Directory holding the emotion folders.")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="Playback rate stored in the pack.")
+    parser.add_argument("--raw", action='store_true', help="Store every frame as RGB565, without a palette.")
+    parser.add_argument("--max_error", type=int, default=MAX_ERROR,
+                        help="Largest color channel error (0-255) of frames mapped to a 256-color palette, "
+                             "0 keeps packs lossless.")
+    parser.add_argument("--report", action='store_true', help="Only report duplicate frames of the built packs.")
+    args = parser.parse_args()
+
+    if not args.report:
+        for emotion in args.emotions or list_emotions(args.image_dir):
+            path, count, stored_raw = build_pack(emotion, args.image_dir, args.fps, args.raw, args.max_error)
+            fallback = f", {stored_raw} stored raw" if stored_raw and not args.raw else ""
+            print(f"{emotion}: {count} frames{fallback}, {os.path.getsize(path) // 1024} KB -> {path}")
+
+    report = dedup_report(args.image_dir)
+    print(f"{report['frames']} frames, {report['unique_in_packs']} unique within their pack, "
+          f"{report['unique']} unique over all packs")
+    print(f"{report['bytes'] // 1024} KB of frames, {report['pack_bytes'] // 1024} KB stored, "
+          f"{report['unique_bytes'] // 1024} KB once shared across emotions")
@@ -0,0 +1,150 @@
+"""
+Procedural Emo face.
+
+Instead of decoding pre-rendered frames, each eye is described by a handful of
+parameters and rasterized with NumPy straight into a big-endian RGB565 frame.
+An emotion is a set of keyframed parameter curves, so it needs no assets, almost
+no memory, and can be changed at runtime.
+
+Eye parameters (positions and sizes in pixels of a 320x240 face, scaled to the
+frame size):
+    x, y        center of the eye
+    width       width of the open eye
+    height      height of the open eye
+    radius      corner radius
+    openness    0 (closed) to 1 (open), scales the height
+    squash      > 1 makes the eye wider and flatter, < 1 narrower and taller
+    pupil_x/y   pupil offset from the center, pupil_radius 0 hides it
+    color       RGB888 tuple
+"""
+import numpy as np
+from lib import rgb565
+
+DESIGN_WIDTH = 320
+DESIGN_HEIGHT = 240
+EYE_COLOR = (138, 213, 226)
+PUPIL_COLOR = (20, 40, 48)
+NUMERIC_PARAMS = ('x', 'y', 'width', 'height', 'radius', 'openness', 'squash',
+                  'pupil_x', 'pupil_y', 'pupil_radius')
+
+LEFT_EYE = {'x': 71, 'y': 97, 'width': 98, 'height': 92, 'radius': 26, 'openness': 1.0, 'squash': 1.0,
+            'pupil_x': 0, 'pupil_y': 0, 'pupil_radius': 0, 'color': EYE_COLOR}
+RIGHT_EYE = dict(LEFT_EYE, x=254)
+
+
+def eyes(left=None, right=None, **both):
+    """Keyframe parameters: the default eyes with changes for both and for each eye"""
+    return {'left': dict(LEFT_EYE, **both, **(left or {})),
+            'right': dict(RIGHT_EYE, **both, **(right or {}))}
+
+
+def _mix(a, b, t):
+    """Linear interpolation of one eye's parameters"""
+    mixed = {name: a[name] + (b[name] - a[name]) * t for name in NUMERIC_PARAMS}
+    mixed['color'] = tuple(ca + (cb - ca) * t for ca, cb in zip(a['color'], b['color']))
+    return mixed
+
+
+class FaceCurve:
+    """An emotion as keyframes [(time in seconds, eyes(...)), ...] played over duration"""
+
+    def __init__(self, keyframes, duration, fps=30):
+        self.keyframes = sorted(keyframes, key=lambda keyframe: keyframe[0])
+        self.duration = duration
+        self.fps = fps
+
+    def at(self, t):
+        """Parameters of both eyes at time t, holding the first and last keyframes"""
+        keyframes = self.keyframes
+        if t <= keyframes[0][0]:
+            return keyframes[0][1]
+        for (t0, a), (t1, b) in zip(keyframes, keyframes[1:]):
+            if t <= t1:
+                u = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+                return {side: _mix(a[side], b[side], u) for side in ('left', 'right')}
+        return keyframes[-1][1]
+
+
+class FaceRenderer:
+    """Rasterizes eye parameters into (height, width) RGB565 frames"""
+
+    def __init__(self, width=DESIGN_WIDTH, height=DESIGN_HEIGHT, background=(0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.scale_x = width / DESIGN_WIDTH
+        self.scale_y = height / DESIGN_HEIGHT
+        self.background = np.array(background, dtype=np.float32)
+        self.background565 = int(rgb565.from_rgb888(np.array([[background]], dtype=np.uint8))[0, 0])
+        self.frame = np.empty((height, width), dtype='>u2')
+
+    def render(self, params):
+        """Draw both eyes of a FaceCurve.at() result. The frame is reused by the next call."""
+        self.frame.fill(self.background565)
+        for side in ('left', 'right'):
+            self._draw_eye(params[side])
+        return self.frame
+
+    def _draw_eye(self, eye):
+        squash = max(eye['squash'], 1e-3)
+        half_w = eye['width'] * squash * self.scale_x / 2
+        half_h = eye['height'] / squash * max(eye['openness'], 0.02) * self.scale_y / 2
+        radius = min(eye['radius'] * min(self.scale_x, self.scale_y), half_w, half_h)
+        cx = eye['x'] * self.scale_x
+        cy = eye['y'] * self.scale_y
+
+        # Only the eye's bounding box is rasterized
+        x0, x1 = max(int(cx - half_w) - 1, 0), min(int(cx + half_w) + 2, self.width)
+        y0, y1 = max(int(cy - half_h) - 1, 0), min(int(cy + half_h) + 2, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        xs = np.arange(x0, x1, dtype=np.float32)[None, :] + 0.5 - cx
+        ys = np.arange(y0, y1, dtype=np.float32)[:, None] + 0.5 - cy
+
+        # Signed distance to a rounded rectangle; one pixel of falloff gives antialiasing
+        qx = np.abs(xs) - (half_w - radius)
+        qy = np.abs(ys) - (half_h - radius)
+        outside = np.hypot(np.maximum(qx, 0), np.maximum(qy, 0))
+        inside = np.minimum(np.maximum(qx, qy), 0)
+        coverage = np.clip(0.5 - (outside + inside - radius), 0, 1)
+
+        color = np.array(eye['color'], dtype=np.float32)
+        region = self.background + coverage[..., None] * (color - self.background)
+        if eye['pupil_radius'] > 0:
+            pupil_radius = eye['pupil_radius'] * min(self.scale_x, self.scale_y)
+            distance = np.hypot(xs - eye['pupil_x'] * self.scale_x, ys - eye['pupil_y'] * self.scale_y)
+            pupil = np.clip(0.5 - (distance - pupil_radius), 0, 1) * coverage
+            region += pupil[..., None] * (np.array(PUPIL_COLOR, dtype=np.float32) - color)
+        self.frame[y0:y1, x0:x1] = rgb565.from_rgb888(region.astype(np.uint8))
+
+
+_BLINK = [(0.0, eyes()), (2.6, eyes()), (2.72, eyes(openness=0.05)), (2.86, eyes()), (3.0, eyes())]
+
+# Procedural emotions, played by name next to the frame-based ones
+EMOTIONS = {
+    'face_neutral': FaceCurve(_BLINK, 3.0),
+    'face_look_around': FaceCurve([
+        (0.0, eyes()),
+        (0.4, eyes(left={'x': 41}, right={'x': 224})),
+        (1.4, eyes(left={'x': 41}, right={'x': 224})),
+        (1.8, eyes(left={'x': 101}, right={'x': 284})),
+        (2.8, eyes(left={'x': 101}, right={'x': 284})),
+        (3.2, eyes()),
+    ], 3.6),
+    'face_happy': FaceCurve([
+        (0.0, eyes(openness=0.45, y=85, squash=1.15)),
+        (0.3, eyes(openness=0.5, y=78, squash=1.2)),
+        (0.6, eyes(openness=0.45, y=85, squash=1.15)),
+    ], 0.6),
+    'face_sleepy': FaceCurve([
+        (0.0, eyes(openness=0.35, y=110)),
+        (1.5, eyes(openness=0.08, y=118)),
+        (2.0, eyes(openness=0.08, y=118)),
+        (3.0, eyes(openness=0.35, y=110)),
+    ], 3.0),
+    'face_surprised': FaceCurve([
+        (0.0, eyes()),
+        (0.15, eyes(width=110, height=110, radius=55, pupil_radius=14)),
+        (1.5, eyes(width=110, height=110, radius=55, pupil_radius=14)),
+        (1.8, eyes(pupil_radius=0)),
+    ], 1.8),
+}
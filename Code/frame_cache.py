@@ -0,0 +1,187 @@
+import queue
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+DEFAULT_BUDGET = 48 * 1024 * 1024  # Bytes, leaves room for MediaPipe on a 512 MB Pi Zero 2 W
+PREFETCH_COUNT = 2  # Likely successors loaded after each emotion starts
+
+# Transitions known before any have been observed: a clap word ends in 'happy' or 'dizzy'
+PREFETCH_HINTS = {
+    'neutral': ['happy', 'dizzy'],
+    'bootup3': ['neutral', 'rat'],
+}
+
+
+class FrameCache:
+    """
+    Decoded emotions kept in memory under a byte budget. An entry is the list of
+    RGB565 frames of one emotion plus its frame rate, as returned by loader(emotion).
+    The least recently used entries are evicted first, except pinned ones (the idle
+    emotion). Emotions likely to follow the one being played are loaded ahead of
+    time on a background thread, from the hints above and the transitions seen so far.
+    Frames with a digest (see emotion_pack) are stored once however many emotions
+    use them, and only count once towards the budget.
+    """
+
+    def __init__(self, loader, budget=DEFAULT_BUDGET):
+        self.loader = loader
+        self.budget = budget
+        # Counters, changed under _lock from both the render and the prefetch thread
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self._entries = OrderedDict()  # emotion -> (frames, fps), oldest first
+        self._frames = {}  # frame key -> [frame, references from cached emotions]
+        self._size = 0  # Bytes of the distinct cached frames
+        self.shared = 0  # Frames loaded that were already cached
+        self._pinned = set()
+        self._loading = {}  # emotion -> Event set once its load finished
+        self._lock = threading.Lock()
+        self._transitions = defaultdict(Counter)
+        for emotion, successors in PREFETCH_HINTS.items():
+            self._transitions[emotion].update(successors)
+        self._last_played = None
+        self._prefetch_queue = queue.Queue()
+        self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._prefetch_thread.start()
+
+    def get(self, emotion):
+        """Return (frames, fps) of an emotion, loading it on a miss"""
+        entry = self._lookup(emotion, count=True)
+        if entry is not None:
+            return entry
+        return self._load(emotion)
+
+    def played(self, emotion):
+        """Record that an emotion started playing and prefetch what usually follows it"""
+        if self._last_played is not None and self._last_played != emotion:
+            self._transitions[self._last_played][emotion] += 1
+        self._last_played = emotion
+        self.prefetch([e for e, _ in self._transitions[emotion].most_common(PREFETCH_COUNT)])
+
+    def prefetch(self, emotions):
+        """Load emotions in the background if they are not cached yet"""
+        for emotion in emotions:
+            self._prefetch_queue.put(emotion)
+
+    def pin(self, emotion):
+        """Never evict an emotion (the idle one); it still counts towards the budget"""
+        with self._lock:
+            self._pinned.add(emotion)
+
+    def unpin(self, emotion):
+        with self._lock:
+            self._pinned.discard(emotion)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            saved = sum(frame.nbytes * (references - 1) for frame, references in self._frames.values())
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'prefetched': self.prefetched,
+                'bytes': self._size,
+                'unique_frames': len(self._frames),
+                'shared_frames': self.shared,
+                'shared_bytes': saved,  # Memory saved right now by sharing frames
+                'budget': self.budget,
+                'emotions': list(self._entries),
+            }
+
+    def _lookup(self, emotion, count=False):
+        """The cached entry of an emotion or None, counted as a hit or miss if count"""
+        with self._lock:
+            entry = self._entries.get(emotion)
+            if entry is not None:
+                self._entries.move_to_end(emotion)
+            if count:
+                if entry is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return entry
+
+    def _load(self, emotion):
+        """Load an emotion, or wait for the thread already loading it"""
+        with self._lock:
+            loading = self._loading.get(emotion)
+            if loading is None:
+                self._loading[emotion] = threading.Event()
+        if loading is not None:
+            loading.wait()
+            entry = self._lookup(emotion)
+            if entry is not None:
+                return entry
+            return self._load(emotion)  # It failed or was too big to keep, try ourselves
+        try:
+            frames, fps = self.loader(emotion)
+            return self._insert(emotion, frames, fps), fps
+        finally:
+            with self._lock:
+                self._loading.pop(emotion).set()
+
+    def _insert(self, emotion, frames, fps):
+        """Cache the frames of an emotion, returning them with cached duplicates swapped in"""
+        with self._lock:
+            distinct = {_frame_key(frame): frame for frame in frames}
+            nbytes = sum(frame.nbytes for key, frame in distinct.items() if key not in self._frames)
+            if nbytes > self.budget and emotion not in self._pinned:
+                return frames  # Served once without being cached
+            frames = [self._share(frame) for frame in frames]
+            if emotion in self._entries:
+                self._release(self._entries.pop(emotion)[0])
+            self._entries[emotion] = (frames, fps)
+            self._evict()
+            return frames
+
+    def _share(self, frame):
+        """The cached frame equal to frame, which becomes cached if there is none. Holds _lock."""
+        key = _frame_key(frame)
+        entry = self._frames.get(key)
+        if entry is None:
+            self._frames[key] = [frame, 1]
+            self._size += frame.nbytes
+            return frame
+        self.shared += 1
+        entry[1] += 1
+        return entry[0]
+
+    def _release(self, frames):
+        for frame in frames:
+            key = _frame_key(frame)
+            entry = self._frames[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._frames[key]
+                self._size -= frame.nbytes
+
+    def _evict(self):
+        """Drop least recently used unpinned entries until the cache fits its budget"""
+        for emotion in list(self._entries):
+            if self._size <= self.budget:
+                break
+            if emotion not in self._pinned:
+                self._release(self._entries.pop(emotion)[0])
+
+    def _prefetch_loop(self):
+        while True:
+            emotion = self._prefetch_queue.get()
+            with self._lock:
+                if emotion in self._entries or emotion in self._loading:
+                    continue
+            try:
+                self._load(emotion)
+                with self._lock:
+                    self.prefetched += 1
+            except (IOError, ValueError) as e:
+                logging.warning(f"Could not prefetch emotion {emotion}: {e}")
+
+
+def _frame_key(frame):
+    """Frames with a digest are identified by it, others (plain arrays) by identity"""
+    digest = getattr(frame, 'digest', None)
+    return digest if digest is not None else id(frame)
@@ -0,0 +1,82 @@
+import queue
+import threading
+
+STREAM_AHEAD = 8  # Frames decoded ahead of playback
+
+
+class FrameStream:
+    """
+    Frames of one emotion decoded in order by a reader thread into a bounded queue,
+    so playback can start as soon as the first frame is ready instead of after
+    the whole emotion was loaded. source() runs on the reader thread too and returns
+    the frame count, the frame rate and read, where read(j) must return frame j as
+    an RGB565 array. A stream goes through the frames once.
+    """
+
+    def __init__(self, source, ahead=STREAM_AHEAD):
+        self.count = None  # Set once opened
+        self.fps = None
+        self._source = source
+        self._opened = threading.Event()
+        self._error = None  # Raised by source()
+        self._frames = queue.Queue(maxsize=ahead)
+        self._closed = threading.Event()
+        self._last = None  # (j, frame) last returned by get()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def wait_open(self, timeout=None):
+        """
+        Wait until count and fps are known, returning False after timeout seconds.
+        Re-raises the error of source().
+        """
+        if not self._opened.wait(timeout):
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def get(self, j, timeout=None):
+        """
+        Wait for frame j, dropping the frames before it. Frames are asked for in
+        increasing order, asking again for the last one returns it again. Raises
+        queue.Empty after timeout seconds, and re-raises the reader's error if
+        frame j could not be decoded.
+        """
+        while self._last is None or self._last[0] < j:
+            k, frame = self._frames.get(timeout=timeout)
+            if isinstance(frame, Exception):
+                raise frame
+            self._last = (k, frame)
+        return self._last[1]
+
+    def close(self):
+        """Stop the reader, also when it is blocked on a full queue"""
+        self._closed.set()
+        while True:
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def _read_loop(self):
+        try:
+            self.count, self.fps, read = self._source()
+        except (IOError, ValueError) as e:
+            self._error = e
+            return
+        finally:
+            self._opened.set()
+        for j in range(self.count):
+            try:
+                item = (j, read(j))
+            except (IOError, ValueError) as e:
+                item = (j, e)
+            while not self._closed.is_set():
+                try:
+                    self._frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if self._closed.is_set() or isinstance(item[1], Exception):
+                return
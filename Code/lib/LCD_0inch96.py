@@ -2,6 +2,28 @@
 import time
 from . import lcdconfig
 
+# (command, parameters, delay in ms after it) sent by Init() after the reset
+INIT_SEQUENCE = (
+    (0x11, (), 100),
+    (0x21, (), 0),
+    (0x21, (), 0),
+    (0xB1, (0x05, 0x3A, 0x3A), 0),
+    (0xB2, (0x05, 0x3A, 0x3A), 0),
+    (0xB3, (0x05, 0x3A, 0x3A, 0x05, 0x3A, 0x3A), 0),
+    (0xB4, (0x03,), 0),
+    (0xC0, (0x62, 0x02, 0x04), 0),
+    (0xC1, (0xC0,), 0),
+    (0xC2, (0x0D, 0x00), 0),
+    (0xC3, (0x8D, 0x6A), 0),
+    (0xC4, (0x8D, 0xEE), 0),
+    (0xC5, (0x0E,), 0),
+    (0xE0, (0x10, 0x0E, 0x02, 0x03, 0x0E, 0x07, 0x02, 0x07, 0x0A, 0x12, 0x27, 0x37, 0x00, 0x0D, 0x0E, 0x10), 0),
+    (0xE1, (0x10, 0x0E, 0x03, 0x03, 0x0F, 0x06, 0x02, 0x08, 0x0A, 0x13, 0x26, 0x36, 0x00, 0x0D, 0x0E, 0x10), 0),
+    (0x3A, (0x05,), 0),
+    (0x36, (0xA8,), 0),
+    (0x29, (), 0),
+)
+
 class LCD_0inch96(lcdconfig.RaspberryPi):
 
     width = 160
@@ -26,100 +48,8 @@ class LCD_0inch96(lcdconfig.RaspberryPi):
     def Init(self):
         """Initialize dispaly"""  
         self.module_init()
-        self.reset()
-
-        self.command(0x11)
-        time.sleep(0.1)
-        self.command(0x21) 
-        self.command(0x21) 
-
-        self.command(0xB1) 
-        self.data(0x05)
-        self.data(0x3A)
-        self.data(0x3A)
-
-        self.command(0xB2)
-        self.data(0x05)
-        self.data(0x3A)
-        self.data(0x3A)
-
-        self.command(0xB3) 
-        self.data(0x05)  
-        self.data(0x3A)
-        self.data(0x3A)
-        self.data(0x05)
-        self.data(0x3A)
-        self.data(0x3A)
-
-        self.command(0xB4)
-        self.data(0x03)
-
-        self.command(0xC0)
-        self.data(0x62)
-        self.data(0x02)
-        self.data(0x04)
-
-        self.command(0xC1)
-        self.data(0xC0)
-
-        self.command(0xC2)
-        self.data(0x0D)
-        self.data(0x00)
-
-        self.command(0xC3)
-        self.data(0x8D)
-        self.data(0x6A)   
-
-        self.command(0xC4)
-        self.data(0x8D) 
-        self.data(0xEE) 
+        self.init_panel(INIT_SEQUENCE)
 
-        self.command(0xC5)
-        self.data(0x0E)    
-
-        self.command(0xE0)
-        self.data(0x10)
-        self.data(0x0E)
-        self.data(0x02)
-        self.data(0x03)
-        self.data(0x0E)
-        self.data(0x07)
-        self.data(0x02)
-        self.data(0x07)
-        self.data(0x0A)
-        self.data(0x12)
-        self.data(0x27)
-        self.data(0x37)
-        self.data(0x00)
-        self.data(0x0D)
-        self.data(0x0E)
-        self.data(0x10)
-
-        self.command(0xE1)
-        self.data(0x10)
-        self.data(0x0E)
-        self.data(0x03)
-        self.data(0x03)
-        self.data(0x0F)
-        self.data(0x06)
-        self.data(0x02)
-        self.data(0x08)
-        self.data(0x0A)
-        self.data(0x13)
-        self.data(0x26)
-        self.data(0x36)
-        self.data(0x00)
-        self.data(0x0D)
-        self.data(0x0E)
-        self.data(0x10)
-
-        self.command(0x3A) 
-        self.data(0x05)
-
-        self.command(0x36)
-        self.data(0xA8)
-
-        self.command(0x29) 
   
     def SetWindows(self, Xstart, Ystart, Xend, Yend):
         #set the X coordinates
@@ -141,38 +71,3 @@ class LCD_0inch96(lcdconfig.RaspberryPi):
         self.data((Yend - 1) & 0xff )
 
         self.command(0x2C)    
-        
-    def ShowImage(self,Image):
-        """Set buffer to value of Python Imaging Library image."""
-        """Write display buffer to physical display"""
-        imwidth, imheight = Image.size
-        if imwidth != self.width or imheight != self.height:
-            if imwidth != self.height or imheight != self.width:
-                raise ValueError('Image must be same dimensions as display \
-                ({0}x{1}).' .format(self.height,self.width))
-            else:
-                img = self.np.asarray(Image)
-                pix = self.np.zeros((self.width,self.hight,2), dtype = self.np.uint8)
-                pix[...,[0]] = self.np.add(self.np.bitwise_and(img[...,[0]],0xF8), self.np.right_shift(img[...,[1]],5))
-                pix[...,[1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[...,[1]],3),0xE0), self.np.right_shift(img[...,[2]],3))               
-        else:       
-            img = self.np.asarray(Image)
-            pix = self.np.zeros((self.height,self.width,2), dtype = self.np.uint8)
-            pix[...,[0]] = self.np.add(self.np.bitwise_and(img[...,[0]],0xF8), self.np.right_shift(img[...,[1]],5))
-            pix[...,[1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[...,[1]],3),0xE0), self.np.right_shift(img[...,[2]],3))
-
-        pix = pix.flatten().tolist()  	
-        self.SetWindows ( 0, 0, self.width, self.height)
-        self.digital_write(self.DC_PIN,self.GPIO.HIGH)
-
-        for i in range(0,len(pix),4096):#The length is 160*160*2 Actually 160*80*2 So take 2
-            self.spi_writebyte(pix[i:i+4096])
-	
-        
-    def clear(self):
-        """Clear contents of image buffer"""
-        _buffer = [0xff]*(self.width * self.height )
-        self.SetWindows ( 0, 0, self.width, self.height)
-        self.digital_write(self.DC_PIN,self.GPIO.HIGH)
-        for i in range(0,len(_buffer),4096):
-            self.spi_writebyte(_buffer[i:i+4096])		
@@ -0,0 +1,122 @@
+"""
+Two round panels used as the left and right eye.
+
+DualLCD looks like one 320x240 landscape display to the Animator: the left half
+of each frame goes to the left panel and the right half to the right one,
+centered in their 240x240 RAM. Two eyes then send as many pixels as one 320x240
+frame. Each frame is written to both panels at once, the right one from a writer
+thread, and ShowBuffer returns when both are done, so the eyes change together.
+
+Panels on two chip selects of one SPI controller (SpiDev(0,0) and (0,1)) share
+its clock: their transfers are interleaved, not faster, and a frame costs what
+one 320x240 frame did. With the right eye on SPI1 (spi=(1,0), dtoverlay=spi1-1cs)
+the writes really run in parallel.
+"""
+import queue
+import threading
+import numpy as np
+from . import rgb565, LCD_1inch28
+
+LEFT_PINS = {'rst': 27, 'dc': 25}
+RIGHT_PINS = {'rst': 22, 'dc': 24}
+
+
+class DualLCD:
+    width = 320
+    height = 240
+    MADCTL_PORTRAIT = None
+    MADCTL_LANDSCAPE = None  # Already landscape, frames are never rotated
+    rgb444 = False
+
+    def __init__(self, left=None, right=None, driver=LCD_1inch28.LCD_1inch28, spi=((0, 0), (0, 1)),
+                 spi_freq=40000000, warm_start=False):
+        """
+        :param left: Driver instance of the left eye, driver(spi=spi[0], **LEFT_PINS) by default
+        :param right: Driver instance of the right eye, driver(spi=spi[1], **RIGHT_PINS) by default
+        """
+        self.left = left if left is not None else \
+            driver(spi=spi[0], spi_freq=spi_freq, warm_start=warm_start, **LEFT_PINS)
+        self.right = right if right is not None else \
+            driver(spi=spi[1], spi_freq=spi_freq, warm_start=warm_start, **RIGHT_PINS)
+        if self.left.RST_PIN == self.right.RST_PIN:
+            raise ValueError("The eyes need their own RST pins, initializing one panel would reset the other")
+        for eye in (self.left, self.right):
+            if eye.width < self.width // 2 or eye.height < self.height:
+                raise ValueError(f"{type(eye).__name__} is too small for half a {self.width}x{self.height} frame")
+        # A shared DC pin is driven for one panel at a time, so the eyes are then written in turn
+        self.parallel = self.left.DC_PIN != self.right.DC_PIN
+        self._jobs = queue.Queue()
+        self._done = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def Init(self):
+        """Initialize both panels, overlapping their reset and power-up delays"""
+        self._both(lambda eye: eye.Init())
+
+    def ShowBuffer(self, buf, landscape=False):
+        """Write a (240, 320) big-endian RGB565 frame, one half to each eye"""
+        self.ShowRegion(buf, (0, 0, self.width, self.height))
+
+    def ShowRegion(self, frame, rect, landscape=False):
+        """Write the (x0, y0, x1, y1) part of a full (240, 320) frame, split between the eyes"""
+        frame = frame.reshape(self.height, self.width)
+        self._both(self._write_half, frame, rect)
+
+    def ShowImage(self, Image):
+        """Convert a 320x240 PIL image to RGB565 and write it to the eyes"""
+        if Image.size != (self.width, self.height):
+            raise ValueError(f"Image must be same dimensions as display ({self.width}x{self.height}).")
+        self.ShowBuffer(rgb565.from_rgb888(Image))
+
+    def clear(self, color=0xFFFF):
+        self._both(lambda eye: eye.clear(color))
+
+    def bl_DutyCycle(self, duty):
+        for eye in (self.left, self.right):
+            eye.bl_DutyCycle(duty)
+
+    def module_exit(self):
+        self._jobs.put(None)
+        self._writer.join()
+        for eye in (self.left, self.right):
+            eye.module_exit()
+
+    def _write_half(self, eye, frame, rect):
+        """Write the part of rect on the eye's half of the frame, centered in its RAM"""
+        half = self.width // 2
+        x_start = 0 if eye is self.left else half
+        x0, y0, x1, y1 = rect
+        x0, x1 = max(x0, x_start), min(x1, x_start + half)
+        if x0 >= x1 or y0 >= y1:
+            return
+        dx = (eye.width - half) // 2 - x_start
+        dy = (eye.height - self.height) // 2
+        eye.begin_frame(eye.MADCTL_PORTRAIT, (x0 + dx, y0 + dy, x1 + dx, y1 + dy))
+        eye.spi_writepixels(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+
+    def _both(self, function, *args):
+        """function(eye, *args) for both eyes, the right one on the writer thread"""
+        if not self.parallel:
+            function(self.left, *args)
+            function(self.right, *args)
+            return
+        self._jobs.put((function, args))
+        try:
+            function(self.left, *args)
+        finally:
+            error = self._done.get()  # Both eyes are done before the next frame starts
+        if error is not None:
+            raise error
+
+    def _write_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            function, args = job
+            try:
+                function(self.right, *args)
+                self._done.put(None)
+            except Exception as e:
+                self._done.put(e)
@@ -0,0 +1,72 @@
+import queue
+import logging
+import threading
+import numpy as np
+
+
+class FramePipeline:
+    """
+    Two-stage display pipeline. The caller prepares the next frame in one of
+    `depth` preallocated buffers while a writer thread streams the previous one
+    to the panel. spidev releases the GIL while the kernel performs the transfer,
+    so preparing and sending overlap and a frame costs max(prepare, transfer).
+    """
+
+    def __init__(self, disp, depth=2):
+        self.disp = disp
+        self._free = queue.Queue()
+        for _ in range(depth):
+            self._free.put(np.empty(disp.width * disp.height, dtype='>u2'))
+        self._ready = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def acquire(self, shape):
+        """Wait for a buffer that is not being sent and return it as a (h, w) array"""
+        return self._free.get().reshape(shape)
+
+    def release(self, buf):
+        """Give back a buffer that turned out not to need sending"""
+        self._free.put(buf.reshape(-1))
+
+    def submit(self, buf, rects=None, landscape=False):
+        """Queue a prepared frame for sending, the whole frame or only rects"""
+        self._ready.put(('frame', buf, rects, landscape))
+
+    def run(self, function, *args):
+        """Run a panel call (clear, backlight...) on the writer thread, in frame order"""
+        self._ready.put(('call', function, args))
+
+    def flush(self):
+        """Wait until everything submitted so far is on the panel"""
+        self._ready.join()
+
+    def close(self):
+        self.flush()
+        self._ready.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        while True:
+            item = self._ready.get()
+            if item is None:
+                self._ready.task_done()
+                return
+            try:
+                if item[0] == 'call':
+                    _, function, args = item
+                    function(*args)
+                else:
+                    _, buf, rects, landscape = item
+                    try:
+                        if rects is None:
+                            self.disp.ShowBuffer(buf, landscape)
+                        else:
+                            for rect in rects:
+                                self.disp.ShowRegion(buf, rect, landscape)
+                    finally:
+                        self.release(buf)
+            except Exception:
+                logging.exception("Error writing to the display")
+            finally:
+                self._ready.task_done()
@@ -0,0 +1,127 @@
+"""
+Display backend writing to a kernel framebuffer.
+
+With the panel driven by the kernel (fbtft or a DRM tiny panel driver, e.g.
+dtoverlay=... on the Pi) the frames are copied into the memory-mapped /dev/fbN
+and the kernel sends them to the panel from its own thread, out of the GIL and
+without spidev's 4096-byte chunks. The framebuffer holds host-order (little
+endian) RGB565, frames are byte-swapped on the way in. Rotation is set by the
+kernel driver, frames are written as the framebuffer is laid out.
+
+A regular file can stand in for the device, given its width and height:
+
+    disp = FramebufferLCD('/tmp/fb.raw', width=320, height=240)
+    disp.Init()
+    animator = Animator(disp=disp)
+"""
+import os
+import re
+import mmap
+import numpy as np
+from . import rgb565
+
+
+def _read_sysfs(name, attribute):
+    with open(f'/sys/class/graphics/{name}/{attribute}') as f:
+        return f.read().strip()
+
+
+def _read_pair(name, attribute):
+    return tuple(int(v) for v in _read_sysfs(name, attribute).split(','))
+
+
+def _visible_size(name):
+    """(width, height) of the current video mode, None if the driver lists no modes"""
+    # First line of modes is the current one, e.g. U:320x240p-0
+    match = re.search(r'(\d+)x(\d+)', _read_sysfs(name, 'modes'))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+class FramebufferLCD:
+    MADCTL_PORTRAIT = None
+    MADCTL_LANDSCAPE = None  # The kernel driver rotates
+    rgb444 = False
+
+    def __init__(self, device='/dev/fb1', width=None, height=None, backlight=None):
+        """
+        Nothing is opened before Init(), so the backend can be created before the
+        display renderer process forks.
+
+        :param device: Framebuffer device, or a regular file of width x height pixels
+        :param width: Width in pixels, the visible one from sysfs for a device
+        :param height: Height in pixels, the visible one from sysfs for a device
+        :param backlight: sysfs backlight directory (/sys/class/backlight/...) for bl_DutyCycle
+        """
+        self.device = device
+        self.backlight = backlight
+        self.stride = None  # Bytes per line, may include padding
+        self.lines = None  # Lines of the framebuffer memory, may be more than the visible ones
+        self.offset = (0, 0)  # (x, y) of the visible area in the framebuffer memory
+        if width is None or height is None:
+            name = os.path.basename(device)
+            bits = int(_read_sysfs(name, 'bits_per_pixel'))
+            if bits != 16:
+                raise ValueError(f"{device} has {bits} bits per pixel, only RGB565 framebuffers are supported")
+            # The virtual size can be larger than the mode, for panning or double buffering
+            virtual_width, self.lines = _read_pair(name, 'virtual_size')
+            width, height = _visible_size(name) or (virtual_width, self.lines)
+            self.offset = _read_pair(name, 'pan')
+            self.stride = int(_read_sysfs(name, 'stride'))
+            if self.stride * 8 // bits < self.offset[0] + width or self.lines < self.offset[1] + height:
+                raise ValueError(f"{device} shows {width}x{height} at {self.offset}, outside its memory")
+        self.width = width
+        self.height = height
+        self.stride = self.stride or 2 * width
+        self.lines = self.lines or height
+        self._file = None
+        self._map = None
+        self.fb = None  # (height, width) host-order view of the framebuffer
+
+    def Init(self):
+        """Map the framebuffer, creating or growing a regular file to the frame size"""
+        size = self.stride * self.lines
+        create = not os.path.exists(self.device) and not self.device.startswith('/dev/')
+        self._file = open(self.device, 'w+b' if create else 'r+b', buffering=0)
+        if os.path.isfile(self.device) and os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        lines = np.frombuffer(self._map, dtype='=u2').reshape(self.lines, self.stride // 2)
+        x, y = self.offset
+        self.fb = lines[y:y + self.height, x:x + self.width]
+
+    def ShowBuffer(self, buf, landscape=False):
+        """Write a display-ready big-endian RGB565 frame of the framebuffer's size"""
+        np.copyto(self.fb, buf.reshape(self.height, self.width))
+
+    def ShowRegion(self, frame, rect, landscape=False):
+        """Write the (x0, y0, x1, y1) part of a full (h, w) RGB565 frame array"""
+        x0, y0, x1, y1 = rect
+        np.copyto(self.fb[y0:y1, x0:x1], frame[y0:y1, x0:x1])
+
+    def ShowImage(self, Image):
+        """Convert a PIL image to RGB565 and write it to the framebuffer"""
+        if Image.size != (self.width, self.height):
+            raise ValueError(f"Image must be same dimensions as display ({self.width}x{self.height}).")
+        self.ShowBuffer(rgb565.from_rgb888(Image))
+
+    def clear(self, color=0xFFFF):
+        """Fill the display with one RGB565 color, white by default"""
+        self.fb[...] = color
+
+    def bl_DutyCycle(self, duty):
+        """Backlight brightness in percent, when a sysfs backlight was given"""
+        if self.backlight is None:
+            return
+        with open(os.path.join(self.backlight, 'max_brightness')) as f:
+            maximum = int(f.read())
+        with open(os.path.join(self.backlight, 'brightness'), 'w') as f:
+            f.write(str(round(maximum * duty / 100)))
+
+    def module_exit(self):
+        self.fb = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -30,13 +30,52 @@
 import os
 import sys
 import time
-import spidev
 import logging
 import numpy as np
+from . import rgb565
+
+def spidev_bufsiz():
+    """Largest single transfer accepted by the spidev kernel driver (spidev.bufsiz)"""
+    try:
+        with open('/sys/module/spidev/parameters/bufsiz') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 4096
+
+# Stands for the COLMOD parameter in an init sequence, self.colmod depends on rgb444
+PIXEL_FORMAT = 'colmod'
+# Where Init() records the sequence a panel was set up with. Cleared when the Pi
+# boots, as the panels lose their configuration with the power.
+WARM_START_DIR = os.environ.get('XDG_RUNTIME_DIR', '/tmp')
 
 class RaspberryPi: # bl default was 18, now is None
-    def __init__(self,spi=spidev.SpiDev(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = None,bl_freq=1000,i2c=None,i2c_freq=100000):
-        import RPi.GPIO      
+    # MADCTL written before frames in the native and in the rotated (landscape)
+    # orientation. None leaves the scan direction set by Init() untouched.
+    MADCTL_PORTRAIT = None
+    MADCTL_LANDSCAPE = None
+    # COLMOD (0x3A) values for 16-bit RGB565 and 12-bit RGB444 pixels. Drivers whose
+    # controller takes RGB444 set the latter and write self.colmod in Init().
+    COLMOD_RGB565 = 0x05
+    COLMOD_RGB444 = None
+    # RAM lines of the vertical scroll area (VSCRDEF/VSCSAD) used by pan(), None when the
+    # driver cannot move the picture without rewriting it
+    SCROLL_LINES = None
+
+    def __init__(self,spi=(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = None,bl_freq=1000,i2c=None,i2c_freq=100000,gpio=None,rgb444=False,warm_start=False):
+        """
+        :param spi: SpiDev-like object, (bus, device) of the spidev to open, or None
+        :param gpio: RPi.GPIO-like module, RPi.GPIO itself by default (see virtual_lcd)
+        :param rgb444: Send 12-bit pixels, 1.5 bytes instead of 2, if the controller supports it
+        :param warm_start: Skip the reset and init sequence in Init() when the panel was already
+            initialized with the same sequence since the Pi booted, e.g. by a restarted process
+        """
+        if rgb444 and self.COLMOD_RGB444 is None:
+            raise ValueError(f"{type(self).__name__} does not support RGB444")
+        self.rgb444 = rgb444
+        self.colmod = self.COLMOD_RGB444 if rgb444 else self.COLMOD_RGB565
+        self.warm_start = warm_start
+        if gpio is None:
+            import RPi.GPIO as gpio # Only imported when a panel is created, not with the module
         self.np=np
         self.RST_PIN= rst
         self.DC_PIN = dc
@@ -44,7 +83,11 @@ class RaspberryPi: # bl default was 18, now is None
         print(f"BL_PIN: {self.BL_PIN}")
         self.SPEED  =spi_freq
         self.BL_freq=bl_freq
-        self.GPIO = RPi.GPIO
+        self.bufsiz = spidev_bufsiz()
+        self._fill_buffers = {}
+        self._madctl = None
+        self._window = None
+        self.GPIO = gpio
         #self.GPIO.cleanup()
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -55,6 +98,12 @@ class RaspberryPi: # bl default was 18, now is None
             self.GPIO.setup(self.BL_PIN,    self.GPIO.OUT)
             self.GPIO.output(self.BL_PIN,   self.GPIO.HIGH)        
         #Initialize SPI
+        self._init_marker = None # Only panels opened here by bus and device can be told apart
+        if isinstance(spi, tuple):
+            self._init_marker = os.path.join(WARM_START_DIR,
+                'emo-{0}-spi{1}.{2}.init'.format(type(self).__name__, *spi))
+            import spidev
+            spi = spidev.SpiDev(*spi)
         self.SPI = spi
         if self.SPI!=None :
             self.SPI.max_speed_hz = spi_freq
@@ -72,13 +121,143 @@ class RaspberryPi: # bl default was 18, now is None
     def spi_writebyte(self, data):
         if self.SPI!=None :
             self.SPI.writebytes(data)
+
+    def send_command(self, cmd, params=()):
+        """Send a command, then all its parameter bytes in a single transfer"""
+        self.digital_write(self.DC_PIN, self.GPIO.LOW)
+        self.spi_writebyte([cmd])
+        if len(params):
+            self.digital_write(self.DC_PIN, self.GPIO.HIGH)
+            self.spi_writebyte(list(params))
+
+    def send_sequence(self, sequence):
+        """Send (command, parameters, delay in ms after it) entries, see send_command"""
+        for cmd, params, delay in sequence:
+            self.send_command(cmd, [self.colmod] if params == PIXEL_FORMAT else params)
+            if delay:
+                self.delay_ms(delay)
+
+    def init_panel(self, sequence):
+        """
+        Reset the panel and send its init sequence, unless warm_start finds it was
+        already sent since boot. Returns whether the panel was initialized.
+        """
+        signature = repr([(cmd, self.colmod if params == PIXEL_FORMAT else tuple(params), delay)
+                          for cmd, params, delay in sequence])
+        if self.warm_start and self._init_marker is not None:
+            try:
+                with open(self._init_marker) as f:
+                    if f.read() == signature:
+                        logging.info("%s already initialized, warm start", type(self).__name__)
+                        if self.SCROLL_LINES is not None:
+                            self.pan(0) # The previous process may have left the picture moved
+                        return False
+            except OSError:
+                pass
+        self.reset()
+        self.send_sequence(sequence)
+        if self._init_marker is not None:
+            try:
+                with open(self._init_marker, 'w') as f:
+                    f.write(signature)
+            except OSError as e:
+                logging.warning("Cannot record the panel init for warm starts: %s", e)
+        return True
+
+    def spi_writepixels(self, pixels):
+        """Write contiguous big-endian RGB565 pixels, packed to RGB444 in 12-bit mode"""
+        self.spi_writebuffer(rgb565.to_rgb444(pixels) if self.rgb444 else pixels)
+
+    def spi_writebuffer(self, buf):
+        """Write a contiguous bytes-like object in as few transfers as bufsiz allows"""
+        if self.SPI!=None :
+            view = memoryview(buf).cast('B')
+            if hasattr(self.SPI, 'writebytes2'):
+                self.SPI.writebytes2(view) # split into bufsiz transfers inside spidev
+            else:
+                for i in range(0, len(view), self.bufsiz):
+                    self.SPI.writebytes(view[i:i+self.bufsiz].tolist())
+
+    def pan(self, offset, landscape=False):
+        """
+        Move the picture offset pixels along the RAM lines, right or down for positive
+        offsets, horizontally for landscape frames and vertically otherwise, by changing
+        the vertical scroll start. Nothing is rewritten: pixels moved off one edge show
+        up at the other one. Returns False when the driver has no SCROLL_LINES.
+        """
+        if self.SCROLL_LINES is None:
+            return False
+        madctl = (self.MADCTL_LANDSCAPE if landscape else self.MADCTL_PORTRAIT) or 0
+        # MX mirrors the frame columns onto the RAM lines when MV is set, MY the rows otherwise
+        mirrored = madctl & (0x40 if madctl & 0x20 else 0x80)
+        start = (offset if mirrored else -offset) % self.SCROLL_LINES
+        self.send_command(0x33, [0x00, 0x00, self.SCROLL_LINES >> 8, self.SCROLL_LINES & 0xff, 0x00, 0x00])
+        self.send_command(0x37, [start >> 8, start & 0xff])
+        return True
+
+    def begin_frame(self, madctl, window):
+        """Point RAM writes at window, resending MADCTL/CASET/RASET only when they changed"""
+        if madctl is not None and madctl != self._madctl:
+            self.command(0x36)
+            self.data(madctl)
+            self._madctl = madctl
+        if window != self._window:
+            self.SetWindows(*window)
+            self._window = window
+        else:
+            self.command(0x2C) # RAMWR restarts at the top-left corner of the window
+        self.digital_write(self.DC_PIN, self.GPIO.HIGH)
+
+    def ShowBuffer(self, buf, landscape=False):
+        """Write a display-ready big-endian RGB565 frame of the panel's size"""
+        if landscape:
+            self.begin_frame(self.MADCTL_LANDSCAPE, (0, 0, self.height, self.width))
+        else:
+            self.begin_frame(self.MADCTL_PORTRAIT, (0, 0, self.width, self.height))
+        self.spi_writepixels(buf)
+
+    def ShowRegion(self, frame, rect, landscape=False):
+        """Write the (x0, y0, x1, y1) part of a full (h, w) RGB565 frame array"""
+        x0, y0, x1, y1 = rect
+        self.begin_frame(self.MADCTL_LANDSCAPE if landscape else self.MADCTL_PORTRAIT, rect)
+        self.spi_writepixels(self.np.ascontiguousarray(frame[y0:y1, x0:x1]))
+
+    def ShowImage(self, Image):
+        """Convert a PIL image to RGB565 and write it to the display"""
+        imwidth, imheight = Image.size
+        landscape = self.MADCTL_LANDSCAPE is not None and \
+            imwidth == self.height and imheight == self.width
+        if not landscape and (imwidth != self.width or imheight != self.height):
+            raise ValueError('Image must be same dimensions as display \
+                ({0}x{1}).' .format(self.width, self.height))
+        self.ShowBuffer(rgb565.from_rgb888(Image), landscape)
+
+    def fill_buffer(self, color, pixels):
+        """Cached, ready to send buffer holding `pixels` pixels of one RGB565 color"""
+        key = (color, pixels)
+        if key not in self._fill_buffers:
+            if self.rgb444:
+                self._fill_buffers[key] = rgb565.to_rgb444(self.np.full(pixels, color, dtype='>u2')).tobytes()
+            else:
+                self._fill_buffers[key] = color.to_bytes(2, 'big') * pixels
+        return self._fill_buffers[key]
+
+    def clear(self, color=0xFFFF):
+        """Fill the display with one RGB565 color, white by default"""
+        self.begin_frame(self.MADCTL_PORTRAIT, (0, 0, self.width, self.height))
+        self.spi_writebuffer(self.fill_buffer(color, self.width * self.height))
+
     def bl_DutyCycle(self, duty):
+        if self.BL_PIN is None:
+            return # No backlight pin, the panel stays fully lit
         self._pwm.ChangeDutyCycle(duty)
         
     def bl_Frequency(self,freq):
         self._pwm.ChangeFrequency(freq)
            
     def module_init(self):
+        self._madctl = None
+        self._window = None
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
         if self.BL_PIN is not None:
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def from_rgb888(image):
+    """Convert a PIL image or (h, w, 3) uint8 array to a (h, w) big-endian RGB565 array"""
+    img = np.asarray(image)
+    r = img[..., 0].astype(np.uint16)
+    g = img[..., 1].astype(np.uint16)
+    b = img[..., 2].astype(np.uint16)
+    pix = np.empty(img.shape[:2], dtype='>u2')
+    pix[...] = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+    return pix
+
+
+def as_frame(buf, width, height):
+    """Zero-copy (height, width) view of a big-endian RGB565 buffer"""
+    return np.frombuffer(buf, dtype='>u2').reshape(height, width)
+
+
+def dirty_rects(prev, cur, min_gap=16):
+    """
+    Bounding rectangles (x0, y0, x1, y1), end exclusive, of the pixels that differ
+    between two frames of the same shape. Changed column ranges separated by at
+    least min_gap unchanged columns (the two eyes, for instance) get their own
+    rectangle. Returns an empty list when the frames are identical.
+    """
+    diff = prev != cur
+    cols = np.flatnonzero(diff.any(axis=0))
+    if len(cols) == 0:
+        return []
+    splits = np.flatnonzero(np.diff(cols) > min_gap)
+    starts = np.concatenate(([cols[0]], cols[splits + 1]))
+    ends = np.concatenate((cols[splits], [cols[-1]])) + 1
+    rects = []
+    for x0, x1 in zip(starts, ends):
+        rows = np.flatnonzero(diff[:, x0:x1].any(axis=1))
+        rects.append((int(x0), int(rows[0]), int(x1), int(rows[-1]) + 1))
+    return rects
+
+
+def blend(a, b, weight, out=None):
+    """
+    Cross-fade two RGB565 frames in integer math: weight 0 gives a, 32 gives b.
+    b may also be a single color and weight an array of per-pixel weights.
+    Red and blue are blended together in one word, green separately, which keeps
+    the whole frame to a handful of vectorized operations.
+    """
+    a = a.astype(np.uint32)
+    b = np.asarray(b).astype(np.uint32)
+    weight = np.clip(weight, 0, 32).astype(np.uint32)
+    rb = ((a & 0xF81F) * (32 - weight) + (b & 0xF81F) * weight) >> 5
+    g = ((a & 0x07E0) * (32 - weight) + (b & 0x07E0) * weight) >> 5
+    if out is None:
+        out = np.empty(a.shape, dtype='>u2')
+    out[...] = (rb & 0xF81F) | (g & 0x07E0)
+    return out
+
+
+def wipe(a, b, x, out=None):
+    """Frame showing b left of column x and a from column x on"""
+    if out is None:
+        out = np.empty(a.shape, dtype='>u2')
+    out[:, :x] = b[:, :x]
+    out[:, x:] = a[:, x:]
+    return out
+
+
+def to_rgb444(pixels):
+    """
+    Pack big-endian RGB565 pixels (array or bytes-like) for 12-bit COLMOD: two pixels
+    in three bytes, R0G0 B0R1 G1B1, keeping the top 4 bits of each channel. An odd
+    pixel count is padded with the first pixel, which is where the controller's
+    address counter wraps to, so the padding rewrites it unchanged.
+    """
+    if not isinstance(pixels, np.ndarray):
+        pixels = np.frombuffer(pixels, dtype='>u2')
+    pixels = pixels.reshape(-1)
+    if len(pixels) % 2:
+        pixels = np.append(pixels, pixels[:1])
+    value = pixels.astype(np.uint16)
+    r = value >> 12
+    g = (value >> 7) & 0xF
+    b = (value >> 1) & 0xF
+    out = np.empty((len(value) // 2, 3), dtype=np.uint8)
+    out[:, 0] = (r[0::2] << 4) | g[0::2]
+    out[:, 1] = (b[0::2] << 4) | r[1::2]
+    out[:, 2] = (g[1::2] << 4) | b[1::2]
+    return out
@@ -0,0 +1,264 @@
+"""
+Virtual panel for running the display stack without a Raspberry Pi.
+
+VirtualGPIO and VirtualSPI stand in for RPi.GPIO and spidev.SpiDev. Every byte
+sent over the virtual bus reaches a VirtualPanel, which records the commands and
+rebuilds the controller RAM from MADCTL/CASET/RASET/RAMWR the way an ST7789 does,
+while the bus adds up the time the transfers would take at the SPI clock set by
+the driver (spi_freq, 40 MHz by default).
+
+    bus = VirtualBus()
+    disp = LCD_2inch.LCD_2inch(spi=bus.spi, gpio=bus.gpio)
+    disp.Init()
+    disp.ShowImage(image)
+    bus.panel.view()  # What the driver wrote, in the orientation it used
+"""
+import time
+from collections import Counter, deque
+import numpy as np
+
+MADCTL = 0x36
+COLMOD = 0x3A
+CASET = 0x2A
+RASET = 0x2B
+RAMWR = 0x2C
+VSCSAD = 0x37
+MADCTL_MY = 0x80
+MADCTL_MX = 0x40
+MADCTL_MV = 0x20
+
+TRANSFER_OVERHEAD = 20e-6  # Seconds per spidev ioctl, on top of clocking the bits out
+COMMAND_LOG = 1000  # Most recent commands kept in VirtualPanel.log
+
+
+class VirtualPanel:
+    """Controller RAM of ram_width x ram_height pixels fed with the SPI byte stream"""
+
+    def __init__(self, ram_width=240, ram_height=320):
+        self.ram = np.zeros((ram_height, ram_width), dtype='>u2')
+        self.madctl = 0
+        self.colmod = 0x05  # Low 3 bits 0b011 select 12-bit pixels, anything else 16-bit here
+        self.window = (0, 0, ram_width - 1, ram_height - 1)  # x0, y0, x1, y1 inclusive
+        self.scroll_start = 0  # RAM line shown on the first line, the whole RAM scrolls
+        self.log = deque(maxlen=COMMAND_LOG)  # (command, parameter bytes), RAMWR data excluded
+        self.command_counts = Counter()
+        self.pixels_written = 0
+        self.pixels_clipped = 0  # Written outside the RAM, usually a wrong window offset
+        self._command = None
+        self._args = bytearray()
+        self._pending = b''  # Odd byte of a pixel split across two transfers
+        self._position = 0  # Next pixel of the window for RAMWR
+
+    def feed(self, dc, data):
+        """Bytes sent with the DC pin low (commands) or high (parameters and pixels)"""
+        if not dc:
+            for cmd in bytes(data):
+                self._start(cmd)
+        elif self._command is None:
+            return  # Data before any command is ignored by the controller
+        elif self._command == RAMWR:
+            self._write_pixels(bytes(data))
+        else:
+            self._args.extend(data)
+            self.log[-1] = (self._command, bytes(self._args))
+            if self._command in (CASET, RASET) and len(self._args) == 4:
+                start = self._args[0] << 8 | self._args[1]
+                end = self._args[2] << 8 | self._args[3]
+                x0, y0, x1, y1 = self.window
+                self.window = (start, y0, end, y1) if self._command == CASET else (x0, start, x1, end)
+            elif self._command == MADCTL and len(self._args) == 1:
+                self.madctl = self._args[0]
+            elif self._command == COLMOD and len(self._args) == 1:
+                self.colmod = self._args[0]
+            elif self._command == VSCSAD and len(self._args) == 2:
+                self.scroll_start = (self._args[0] << 8 | self._args[1]) % self.ram.shape[0]
+
+    def view(self, madctl=None, rect=None, scrolled=False):
+        """
+        RAM as addressed with madctl (the current one by default), the way a driver
+        using that MADCTL wrote it, cropped to an (x0, y0, x1, y1) end-exclusive rect.
+        With scrolled, what the panel shows after the vertical scroll instead.
+        """
+        madctl = self.madctl if madctl is None else madctl
+        height, width = self._logical_shape(madctl)
+        x0, y0, x1, y1 = rect if rect is not None else (0, 0, width, height)
+        rows, cols = np.meshgrid(np.arange(y0, y1), np.arange(x0, x1), indexing='ij')
+        ram = np.roll(self.ram, -self.scroll_start, axis=0) if scrolled else self.ram
+        return ram[self._ram_index(rows, cols, madctl)]
+
+    def _start(self, cmd):
+        self.command_counts[cmd] += 1
+        self._command = cmd
+        self._args = bytearray()
+        self.log.append((cmd, b''))
+        if cmd == RAMWR:
+            self._pending = b''
+            self._position = 0
+
+    def _logical_shape(self, madctl):
+        height, width = self.ram.shape
+        return (width, height) if madctl & MADCTL_MV else (height, width)
+
+    def _ram_index(self, rows, cols, madctl):
+        """RAM (row, col) index arrays of logical row and column addresses"""
+        height, width = self._logical_shape(madctl)
+        if madctl & MADCTL_MY:
+            rows = height - 1 - rows
+        if madctl & MADCTL_MX:
+            cols = width - 1 - cols
+        return (cols, rows) if madctl & MADCTL_MV else (rows, cols)
+
+    def _write_pixels(self, data):
+        data = self._pending + data
+        if self.colmod & 0x07 == 0x03:
+            pairs = len(data) // 3
+            self._pending = data[3 * pairs:]
+            pixels = _rgb444_to_rgb565(np.frombuffer(data, dtype=np.uint8, count=3 * pairs))
+        else:
+            count = len(data) // 2
+            self._pending = data[2 * count:]
+            pixels = np.frombuffer(data, dtype='>u2', count=count)
+        count = len(pixels)
+        if count == 0:
+            return
+        x0, y0, x1, y1 = self.window
+        window_width = x1 - x0 + 1
+        window_size = window_width * (y1 - y0 + 1)
+        if window_width <= 0 or window_size <= 0:
+            return
+        # The address counter wraps back to the first pixel after the end of the window
+        positions = (self._position + np.arange(count)) % window_size
+        self._position = (self._position + count) % window_size
+        rows = y0 + positions // window_width
+        cols = x0 + positions % window_width
+        height, width = self._logical_shape(self.madctl)
+        inside = (rows < height) & (cols < width)
+        if not inside.all():
+            self.pixels_clipped += count - int(inside.sum())
+            rows, cols, pixels = rows[inside], cols[inside], pixels[inside]
+        self.ram[self._ram_index(rows, cols, self.madctl)] = pixels
+        self.pixels_written += count
+
+
+def _rgb444_to_rgb565(data):
+    """Unpack R0G0 B0R1 G1B1 byte triplets to RGB565, as the controller widens them"""
+    triplets = data.reshape(-1, 3).astype(np.uint16)
+    nibbles = np.empty((len(triplets), 6), dtype=np.uint16)
+    nibbles[:, 0::2] = triplets >> 4
+    nibbles[:, 1::2] = triplets & 0xF
+    r, g, b = nibbles.reshape(-1, 3).T
+    return (((r << 1 | r >> 3) << 11) | ((g << 2 | g >> 2) << 5) | (b << 1 | b >> 3)).astype('>u2')
+
+
+class VirtualPWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty = None  # None while stopped
+
+    def start(self, duty):
+        self.duty = duty
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.duty = None
+
+
+class VirtualGPIO:
+    """The part of the RPi.GPIO module used by lcdconfig, keeping the pin levels"""
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.levels = {}
+        self.pwms = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode):
+        self.levels.setdefault(pin, self.LOW)
+
+    def output(self, pin, value):
+        self.levels[pin] = self.HIGH if value else self.LOW
+
+    def input(self, pin):
+        return self.levels.get(pin, self.LOW)
+
+    def PWM(self, pin, frequency):
+        self.pwms[pin] = VirtualPWM(pin, frequency)
+        return self.pwms[pin]
+
+    def cleanup(self):
+        self.levels.clear()
+
+
+class VirtualSPI:
+    """
+    spidev.SpiDev writing to a VirtualPanel. bus_time adds up how long the transfers
+    take at max_speed_hz; with realtime the writes also sleep that long, releasing
+    the GIL like the real driver, so pipelining can be measured.
+    """
+
+    def __init__(self, panel, gpio, dc=25, realtime=False, overhead=TRANSFER_OVERHEAD, bufsiz=4096):
+        self.panel = panel
+        self.gpio = gpio
+        self.dc = dc
+        self.realtime = realtime
+        self.overhead = overhead
+        self.bufsiz = bufsiz
+        self.max_speed_hz = 40000000
+        self.mode = 0
+        self.bus_time = 0.0
+        self.bytes_written = 0
+        self.transfers = 0
+
+    def writebytes(self, data):
+        self._transfer(bytes(data), 1)
+
+    def writebytes2(self, data):
+        view = memoryview(data).cast('B')
+        self._transfer(view, max(1, -(-len(view) // self.bufsiz)))
+
+    def close(self):
+        pass
+
+    def _transfer(self, data, transfers):
+        self.panel.feed(self.gpio.input(self.dc), data)
+        seconds = len(data) * 8 / self.max_speed_hz + transfers * self.overhead
+        self.bus_time += seconds
+        self.bytes_written += len(data)
+        self.transfers += transfers
+        if self.realtime:
+            time.sleep(seconds)
+
+
+class VirtualBus:
+    """A VirtualPanel with the VirtualSPI and VirtualGPIO to pass to an LCD driver"""
+
+    def __init__(self, ram_width=240, ram_height=320, dc=25, realtime=False, overhead=TRANSFER_OVERHEAD):
+        self.panel = VirtualPanel(ram_width, ram_height)
+        self.gpio = VirtualGPIO()
+        self.spi = VirtualSPI(self.panel, self.gpio, dc, realtime, overhead)
+
+    def stats(self):
+        return {
+            'bus_time': self.spi.bus_time,
+            'bytes': self.spi.bytes_written,
+            'transfers': self.spi.transfers,
+            'pixels': self.panel.pixels_written,
+            'pixels_clipped': self.panel.pixels_clipped,
+            'commands': dict(self.panel.command_counts),
+        }
@@ -0,0 +1,184 @@
+"""
+Status overlay drawn over the face.
+
+Text and icons are composited into the outgoing RGB565 frames from a glyph atlas
+rasterized once, so changing the overlay draws no PIL images. The Animator keeps
+the frame under the overlay, which lets it send an overlay-only change as the
+overlay's rectangle alone.
+
+Item positions are in pixels of the frame, negative x or y place the item's right
+or bottom edge that far from the right or bottom edge of the frame.
+"""
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from lib import rgb565
+
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+FONT_SIZE = 14
+TEXT_COLOR = (255, 255, 255)
+CHARACTERS = ''.join(chr(c) for c in range(32, 127))
+TEXT_CACHE = 64  # Rendered strings kept, the overlay shows a few that change slowly
+
+# 8x8 icons, scaled up to about the line height
+ICONS = {
+    'up': ('...XX...',
+           '..XXXX..',
+           '.XXXXXX.',
+           'XXXXXXXX',
+           '...XX...',
+           '...XX...',
+           '...XX...',
+           '...XX...'),
+    'down': ('...XX...',
+             '...XX...',
+             '...XX...',
+             '...XX...',
+             'XXXXXXXX',
+             '.XXXXXX.',
+             '..XXXX..',
+             '...XX...'),
+    'note': ('...XXXXX',
+             '...XXXXX',
+             '...X...X',
+             '...X...X',
+             '.XXX.XXX',
+             'XXXXXXXX',
+             'XXXXXXXX',
+             '.XX..XX.'),
+    'dot': ('........',
+            '..XXXX..',
+            '.XXXXXX.',
+            '.XXXXXX.',
+            '.XXXXXX.',
+            '.XXXXXX.',
+            '..XXXX..',
+            '........'),
+}
+
+
+class GlyphAtlas:
+    """Coverage masks (0-255) of characters and icons, rasterized once for one line height"""
+
+    def __init__(self, font_path=FONT_PATH, size=FONT_SIZE, characters=CHARACTERS):
+        try:
+            font = ImageFont.truetype(font_path, size)
+        except OSError:
+            try:
+                font = ImageFont.load_default(size)
+            except TypeError:
+                font = ImageFont.load_default()  # Pillow < 10.1 only has the fixed size bitmap font
+        if hasattr(font, 'getmetrics'):
+            ascent, descent = font.getmetrics()
+            self.height = ascent + descent
+        else:
+            self.height = font.getbbox(characters)[3]  # The bitmap font has no metrics
+        widths = [max(1, round(font.getlength(c))) for c in characters]
+        self.atlas = np.zeros((self.height, sum(widths)), dtype=np.uint8)
+        self.glyphs = {}  # character -> (x0, x1) columns of the atlas
+        x = 0
+        for c, width in zip(characters, widths):
+            # Each glyph gets its own cell, overhangs are cut instead of bleeding into neighbours
+            cell = Image.new('L', (width, self.height))
+            ImageDraw.Draw(cell).text((0, 0), c, fill=255, font=font)
+            self.atlas[:, x:x + width] = np.asarray(cell)
+            self.glyphs[c] = (x, x + width)
+            x += width
+        scale = max(1, round(self.height / 8))
+        self.icons = {name: np.kron(np.array([[255 * (p == 'X') for p in row] for row in rows], dtype=np.uint8),
+                                    np.ones((scale, scale), dtype=np.uint8))
+                      for name, rows in ICONS.items()}
+        self._texts = {}
+
+    def text(self, text):
+        """Mask of a line of text, unknown characters drawn as '?'"""
+        if text not in self._texts:
+            if len(self._texts) >= TEXT_CACHE:
+                self._texts.clear()
+            columns = [self.glyphs.get(c, self.glyphs['?']) for c in text]
+            if columns:
+                mask = np.concatenate([self.atlas[:, x0:x1] for x0, x1 in columns], axis=1)
+            else:
+                mask = np.zeros((self.height, 0), dtype=np.uint8)
+            self._texts[text] = mask
+        return self._texts[text]
+
+
+def parse_color(color):
+    """An (r, g, b) tuple of ints 0-255 from any three numbers, ValueError otherwise"""
+    try:
+        r, g, b = (int(round(c)) for c in color)
+    except (TypeError, ValueError):
+        raise ValueError(f"Color must be three numbers (r, g, b), got {color!r}") from None
+    if not all(0 <= c <= 255 for c in (r, g, b)):
+        raise ValueError(f"Color components must be within 0-255, got {color!r}")
+    return r, g, b
+
+
+def _to_rgb565(color):
+    r, g, b = parse_color(color)
+    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+
+
+class Overlay:
+    """Named text and icon items composited over frames. Used by the render thread only."""
+
+    def __init__(self, atlas=None):
+        self._atlas = atlas  # Rasterized on first use, most runs never show an overlay
+        self.items = {}  # name -> (x, y, mask, RGB565 color)
+        self._frame = None  # Composed frame, reused
+
+    @property
+    def atlas(self):
+        if self._atlas is None:
+            self._atlas = GlyphAtlas()
+        return self._atlas
+
+    def set_text(self, name, text, x=4, y=4, color=TEXT_COLOR):
+        self.items[name] = (x, y, self.atlas.text(str(text)), _to_rgb565(color))
+
+    def set_icon(self, name, icon, x=4, y=4, color=TEXT_COLOR):
+        if icon not in ICONS:
+            raise ValueError(f"Unknown icon {icon}, expected one of {tuple(ICONS)}")
+        self.items[name] = (x, y, self.atlas.icons[icon], _to_rgb565(color))
+
+    def remove(self, name=None):
+        """Remove one item, or all of them"""
+        if name is None:
+            self.items.clear()
+        else:
+            self.items.pop(name, None)
+
+    def compose(self, frame):
+        """
+        frame with the items drawn over it, in a buffer reused by the next call,
+        or frame itself when there are none
+        """
+        height, width = frame.shape
+        placed = [(self._place(x, y, mask, width, height), mask, color)
+                  for x, y, mask, color in self.items.values()]
+        placed = [item for item in placed if item[0] is not None]
+        if not placed:
+            return frame
+        if self._frame is None or self._frame.shape != frame.shape:
+            self._frame = np.empty(frame.shape, dtype='>u2')
+        np.copyto(self._frame, frame)
+        for (bx0, by0, bx1, by1, mx, my), mask, color in placed:
+            coverage = mask[my:my + by1 - by0, mx:mx + bx1 - bx0]
+            region = self._frame[by0:by1, bx0:bx1]
+            rgb565.blend(region, color, (coverage.astype(np.uint16) * 33) >> 8, out=region)
+        return self._frame
+
+    @staticmethod
+    def _place(x, y, mask, width, height):
+        """
+        (x0, y0, x1, y1) of an item clipped to the frame and the offset (mx, my) of
+        that box into its mask, None when it is outside the frame
+        """
+        mask_height, mask_width = mask.shape
+        x = x if x >= 0 else width + x - mask_width
+        y = y if y >= 0 else height + y - mask_height
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask_width, width), min(y + mask_height, height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1, x0 - x, y0 - y
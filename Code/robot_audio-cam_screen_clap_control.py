@@ -1,3 +1,8 @@
+from display_module import DisplayControl
+
+# The display renderer is forked before camera, audio and inference modules load or threads start
+display = DisplayControl(boot='bootup3')  # The boot animation starts while the models load
+
 import argparse
 import threading
 from time import sleep
@@ -6,7 +11,6 @@ import psutil  # For setting CPU affinity
 from camera_module import CameraModule
 from clap_module import ClapDetector
 from adafruit_servokit import ServoKit
-from display_module import DisplayControl
 # Function to display 'neutral' when idle and 'happy' when a word is detected
 from sound_module import SoundModule  # Updated import to use the SoundModule class
 import os
@@ -42,6 +46,7 @@ def reset_ignore_camera():
 
 left_arm_state = 'down'
 right_arm_state = 'down'
+clap_word = ''  # Clap symbols of the word being built, shown over the face
 rng = np.random.default_rng()
 f_chance = 0.01
 interacting_lock = threading.Lock()
@@ -53,8 +58,6 @@ bb = 11 # base arm index in motor driver
 if kit is not None:
     kit.servo[bb].angle = 30
 
-# Initialize the DisplayControl instance
-display = DisplayControl()
 
 import os
 os.system("raspi-gpio set 18 a0")  # Set GPIO 18 to PCM_Clock
@@ -100,6 +103,8 @@ def move_arm(arm_side, up_down):
     
     if changed_state:
         print(f"Moving {arm_side} arm {up_down}")
+        # Arm state in the bottom corners, mirrored like the arms seen from the front
+        display.set_overlay_icon(f"{arm_side}_arm", up_down, -4 if arm_side == 'left' else 4, -4)
 
 # Function to display 'neutral' when idle and 'happy' when a word is detected
 # def display_neutral():
@@ -113,12 +118,17 @@ def move_arm(arm_side, up_down):
 
 def on_waiting_second_clap():
     set_ignore_camera()
+    display.notify_event()
+    display.prefetch(['happy', 'dizzy'])  # A word may be about to complete
     print("on_waiting_second_clap")
     sound_module.speak_ping()
     print("on_waiting_second_clap after speak")
 
 def on_clap_detected(symbol):
+    global clap_word
     reset_ignore_camera()
+    clap_word += symbol
+    display.set_overlay_text('word', clap_word)
     print(f"on_clap_detected: {symbol}")
     sound_module.speak_pong()
     print("on_clap_detected after speak")
@@ -134,9 +144,12 @@ def on_word_completed(word):
     global left_arm_state
     global right_arm_state
     global sound_module
+    global clap_word
 
     valid_word = True
     print(f"Word Detected: {word}")
+    clap_word = ''
+    display.clear_overlay('word')
     print(f"right_arm_state: {right_arm_state}")
     print(f"left_arm_state: {left_arm_state}")
 
@@ -260,6 +273,8 @@ def start_camera_module(args):
         global _ignore_camera
         if _ignore_camera:
             return
+        if hand_state is not None:
+            display.notify_event()  # Someone is there, keep the face awake
         if hand_state is None:
             pass
         elif hand_state == "open_hand":
@@ -273,6 +288,8 @@ def start_camera_module(args):
         global _ignore_camera
         if _ignore_camera:
             return
+        if arm_state is not None:
+            display.notify_event()
 
         if arm_state is None:
             pass # No arm detected
@@ -349,7 +366,9 @@ if __name__ == "__main__":
     set_cpu_affinity(clap_thread, [0,1])
     #set_cpu_affinity(fart_thread, [1, 2])
 
-    display.display_face_and_return_to_neutral('rat')
+    # Rat follows the boot animation instead of cutting it, then back to 'neutral'
+    display.set_idle('neutral')
+    display.enqueue_next('rat')
 
    
     # Wait for both threads to complete (if needed)
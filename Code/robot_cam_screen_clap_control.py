@@ -1,10 +1,14 @@
+from display_module import DisplayControl
+
+# The display renderer is forked before camera, audio and inference modules load or threads start
+display = DisplayControl()
+
 import argparse
 import threading
 import psutil  # For setting CPU affinity
 from camera_module import CameraModule
 from clap_module import ClapDetector
 from adafruit_servokit import ServoKit
-from display_module import DisplayControl  # Importing the updated display module
 
 
 # Initialize the ServoKit instance for 16 channels
@@ -18,8 +22,6 @@ import os
 os.system("raspi-gpio set 18 a0")  # Set GPIO 18 to PCM_Clock
 
 
-# Initialize the DisplayControl instance
-display = DisplayControl()
 
 
 
@@ -1,17 +1,20 @@
+from display_module import DisplayControl
+
+# The display renderer is forked before camera, audio and inference modules load or threads start
+display = DisplayControl()
+
 import time
 
 import numpy as np
 from adafruit_servokit import ServoKit
-from display_module import DisplayControl
 from mediapipe.tasks import python
 from mediapipe.tasks.python import audio
 from mediapipe.tasks.python.audio.core import audio_record
 from mediapipe.tasks.python.components import containers
 import threading
 
-# Initialize ServoKit and DisplayControl instances
+# Initialize ServoKit instance
 kit = ServoKit(channels=16)
-display = DisplayControl()
 
 # Define robot poses (angles for right arm, left arm, and base)
 poses = [
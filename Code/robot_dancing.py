@@ -1,11 +1,17 @@
+from display_module import DisplayControl
+
+# The display renderer is forked before camera, audio and inference modules load or threads start
+display = DisplayControl()
+
 import numpy as np
 import sounddevice as sd
 import scipy.signal
 import time
 from scipy.ndimage import gaussian_filter1d
+from audio_ring import AudioRing
+from audio_envelope import block_envelope, ENVELOPE_RATE
 #import matplotlib.pyplot as plt
 from adafruit_servokit import ServoKit
-from display_module import DisplayControl
 
 
 # Initialize ServoKit instance
@@ -14,7 +20,6 @@ kit = ServoKit(channels=16)
 import os
 os.system("raspi-gpio set 18 a0")  # Set GPIO 18 to PCM_Clock
 
-display = DisplayControl()
 
 # Stop dancing when there's no music
 stop_dancing = True
@@ -40,7 +45,8 @@ class RobotDanceBPM:
                  threshold=0.010,
                  lowpass_sigma=10,
                  highpass_freq=500,
-                 max_to_mean_radio_threshold=10):
+                 max_to_mean_radio_threshold=10,
+                 envelope_rate=ENVELOPE_RATE):
         # Audio processing parameters
         self.sample_rate = sample_rate
         self.window_duration = window_duration
@@ -49,28 +55,23 @@ class RobotDanceBPM:
         self.highpass_freq = highpass_freq
         self.max_to_mean_radio_threshold = max_to_mean_radio_threshold
         self.wait_samples = int(window_duration*sample_rate//4)
+        self.highpass_sos = scipy.signal.butter(4, highpass_freq, btype='highpass', fs=sample_rate, output='sos')
+        # Beats are searched in the peak envelope, one value per envelope_factor samples
+        self.envelope_factor = max(1, round(sample_rate / envelope_rate))
 
         # Circular buffer for audio samples
         self.buffer_size = int(sample_rate * window_duration)
-        self.audio_buffer = np.zeros(self.buffer_size)
+        self.audio = AudioRing(self.buffer_size)  # Written by the audio callback only
 
         # Robot pose control
         self.current_pose = poses[0]
         self.current_pose_index = 0
         self.next_sequence = np.random.permutation(poses)
-        self.new_samples = 0
+        self.analysed_samples = 0  # audio.written when the last window was analysed
 
     def audio_callback(self, indata, frames, time_info, status):
         """Callback function to continuously capture audio."""
-        # Ensure we handle the case where frames might exceed the buffer size
-        frames_to_use = min(frames, self.buffer_size)
-        self.new_samples += frames_to_use
-
-        # Shift the buffer left by the number of frames
-        self.audio_buffer[:-frames_to_use] = self.audio_buffer[frames_to_use:]
-
-        # Append the new audio data to the end of the buffer
-        self.audio_buffer[-frames_to_use:] = indata[:frames_to_use, 0]  # Mono channel
+        self.audio.write(indata[:frames, 0])  # Mono channel
 
     def apply_threshold(self, signal):
         """Apply a threshold to the signal, zeroing out values below the threshold."""
@@ -78,8 +79,7 @@ class RobotDanceBPM:
 
     def highpass_filter(self, signal):
         """Apply a high-pass filter to remove motor noise."""
-        sos = scipy.signal.butter(4, self.highpass_freq, btype='highpass', fs=self.sample_rate, output='sos')
-        return scipy.signal.sosfilt(sos, signal)
+        return scipy.signal.sosfilt(self.highpass_sos, signal)
 
     def lowpass_smooth(self, signal):
         """Apply Gaussian smoothing as a low-pass filter to remove high-frequency noise."""
@@ -91,9 +91,18 @@ class RobotDanceBPM:
         smoothed_signal = self.lowpass_smooth(filtered_signal)
         return smoothed_signal
 
+    def envelope(self, signal):
+        """
+        Peak envelope of the signal, and the index in signal of the loudest sample behind
+        each value. The oldest samples that do not fill a whole envelope bin are left out.
+        """
+        skip = len(signal) % self.envelope_factor
+        values, positions = block_envelope(signal[skip:], self.envelope_factor)
+        return values, positions + skip
+
     def find_local_maxima(self, signal):
-        """Find local maxima in the signal to detect beats."""
-        peaks, _ = scipy.signal.find_peaks(signal, distance=self.sample_rate / 2)
+        """Find local maxima in the envelope to detect beats."""
+        peaks, _ = scipy.signal.find_peaks(signal, distance=self.sample_rate / self.envelope_factor / 2)
         return peaks
 
     def calculate_bpm(self, peaks):
@@ -110,11 +119,13 @@ class RobotDanceBPM:
         # Apply threshold and smoothing
         #filtered_signal = self.highpass_filter(self.audio_buffer)
         thresholded_signal = self.apply_threshold(current_audio)
-        bandpassed_signal = self.bandpass_filter(thresholded_signal)
+        filtered_signal = self.highpass_filter(thresholded_signal)
         #smoothed_signal = self.apply_gaussian_smoothing(thresholded_signal)
+        # The 1 ms envelope bins low-pass the signal in place of lowpass_smooth
+        bandpassed_signal, positions = self.envelope(filtered_signal)
 
-        # Detect peaks and calculate BPM
-        peaks = self.find_local_maxima(bandpassed_signal)
+        # Detect peaks in the envelope, placed back on the samples, and calculate BPM
+        peaks = positions[self.find_local_maxima(bandpassed_signal)]
         bpm = self.calculate_bpm(peaks)
 
         return bpm, peaks, bandpassed_signal
@@ -182,11 +193,12 @@ class RobotDanceBPM:
             while True:
                 stop_dancing = False
                 #time.sleep(self.window_duration)  # Wait for the duration of the window (5 seconds)
-                if self.new_samples > self.wait_samples:
-                    print(f"self.new_samples: {self.new_samples}")
-                    self.new_samples = 0
+                new_samples = self.audio.written - self.analysed_samples
+                if new_samples > self.wait_samples:
+                    print(f"new_samples: {new_samples}")
+                    self.analysed_samples = self.audio.written
                     # Estimate BPM from the current window
-                    current_audio = self.audio_buffer[-self.wait_samples:].copy()
+                    current_audio = self.audio.read(self.wait_samples)
                     bpm, peaks, bandpassed_signal = self.process_audio_window(current_audio)
 
                     abs_audio = np.abs(current_audio)
@@ -213,11 +225,13 @@ class RobotDanceBPM:
                     if (np.mean(abs_audio)/abs_audio.max()) < 0.1:
                         print("\nStop dancing\n")
                         stop_dancing = True
+                        display.clear_overlay('bpm')
                         display.show('neutral', -1, stop_now=True)
                         continue
                     
                     if bpm > 0:
                         print(f"Estimated BPM: {bpm}")
+                        display.set_overlay_text('bpm', f"{bpm} BPM")
                         display.show('happy', -1, stop_now=True)
                         self.dance_to_bpm(bpm)
                     else:
@@ -1,12 +1,14 @@
+from display_module import DisplayControl
+
+# The display renderer is forked before camera, audio and inference modules load or threads start
+display = DisplayControl()
+
 from clap_module import ClapDetector
 from adafruit_servokit import ServoKit
-from display_module import DisplayControl  # Importing the updated display module
 
 # Initialize the ServoKit instance for 16 channels
 kit = ServoKit(channels=16)
 
-# Initialize the DisplayControl instance
-display = DisplayControl()
 
 
 import os